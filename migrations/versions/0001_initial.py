@@ -0,0 +1,50 @@
+"""Исходная схема (то, что раньше создавал create_all при старте)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Базы, созданные старым create_all, уже содержат эти таблицы
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table('users'):
+        op.create_table(
+            'users',
+            # SQLite не умеет autoincrement в составном ключе, id там назначается после 0002
+            sa.Column('id', sa.Integer(), autoincrement=bind.dialect.name != 'sqlite', nullable=False),
+            sa.Column('login', sa.String(), nullable=False),
+            sa.Column('email', sa.String(), nullable=False),
+            sa.Column('password', sa.String(), nullable=False),
+            sa.Column('verify', sa.Boolean(), nullable=False),
+            sa.PrimaryKeyConstraint('id', 'login', name='users_pkey'),
+            sa.UniqueConstraint('id', name='users_id_key'),
+            sa.UniqueConstraint('email', name='users_email_key'),
+        )
+    if not inspector.has_table('photos'):
+        op.create_table(
+            'photos',
+            sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('timestamp', sa.DateTime(), nullable=False),
+            sa.Column('url', sa.String(), nullable=False),
+            sa.Column('isProcessed', sa.Boolean(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id', name='photos_pkey'),
+            sa.UniqueConstraint('id', name='photos_id_key'),
+        )
+
+
+def downgrade():
+    op.drop_table('photos')
+    op.drop_table('users')
@@ -0,0 +1,69 @@
+"""Генерируемые базой id, уникальный login, photos.size и счетчики photo_stats
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    is_postgres = bind.dialect.name == 'postgresql'
+
+    # login больше не входит в первичный ключ, но уникален сам по себе
+    if inspector.get_pk_constraint('users')['constrained_columns'] != ['id']:
+        with op.batch_alter_table('users') as batch:
+            batch.drop_constraint('users_pkey', type_='primary')
+            batch.create_primary_key('users_pkey', ['id'])
+    user_indexes = {index['name'] for index in inspector.get_indexes('users')}
+    if 'uq_users_login' not in user_indexes:
+        op.create_index('uq_users_login', 'users', ['login'], unique=True)
+
+    # Строки вставлялись с явными id: сдвигаем последовательности за максимум
+    if is_postgres:
+        for table in ('users', 'photos'):
+            op.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+            )
+
+    if 'size' not in {column['name'] for column in inspector.get_columns('photos')}:
+        op.add_column('photos', sa.Column('size', sa.BigInteger(), nullable=False, server_default='0'))
+
+    if not inspector.has_table('photo_stats'):
+        op.create_table(
+            'photo_stats',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('total', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('processed', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('pending', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('bytes', sa.BigInteger(), nullable=False, server_default='0'),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('user_id'),
+        )
+        op.execute(
+            'INSERT INTO photo_stats (user_id, total, processed, pending, bytes) '
+            'SELECT user_id, COUNT(id), '
+            'SUM(CASE WHEN "isProcessed" THEN 1 ELSE 0 END), '
+            'SUM(CASE WHEN "isProcessed" THEN 0 ELSE 1 END), '
+            'COALESCE(SUM(size), 0) '
+            'FROM photos GROUP BY user_id'
+        )
+
+
+def downgrade():
+    op.drop_table('photo_stats')
+    op.drop_column('photos', 'size')
+    op.drop_index('uq_users_login', table_name='users')
+    with op.batch_alter_table('users') as batch:
+        batch.drop_constraint('users_pkey', type_='primary')
+        batch.create_primary_key('users_pkey', ['id', 'login'])
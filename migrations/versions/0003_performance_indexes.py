@@ -0,0 +1,46 @@
+"""Индексы под основные запросы к photos
+
+users.email уже покрыт уникальным ограничением users_email_key, отдельный индекс не нужен.
+photos.user_id покрывается префиксом составного индекса ix_photos_user_timestamp,
+photos.isProcessed - частичными индексами по необработанным фото.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('photos')}
+    pending = sa.text('"isProcessed" = false')
+
+    if 'ix_photos_user_timestamp' not in existing:
+        op.create_index(
+            'ix_photos_user_timestamp', 'photos',
+            ['user_id', sa.text('timestamp DESC'), sa.text('id DESC')]
+        )
+    if 'ix_photos_user_pending' not in existing:
+        op.create_index(
+            'ix_photos_user_pending', 'photos',
+            ['user_id', sa.text('timestamp DESC'), sa.text('id DESC')],
+            postgresql_where=pending, sqlite_where=pending
+        )
+    if 'ix_photos_pending' not in existing:
+        op.create_index(
+            'ix_photos_pending', 'photos', ['timestamp'],
+            postgresql_where=pending, sqlite_where=pending
+        )
+
+
+def downgrade():
+    op.drop_index('ix_photos_pending', table_name='photos')
+    op.drop_index('ix_photos_user_pending', table_name='photos')
+    op.drop_index('ix_photos_user_timestamp', table_name='photos')
@@ -0,0 +1,24 @@
+"""sha256 содержимого и MIME-тип загруженного фото
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('photos', sa.Column('content_hash', sa.String(), nullable=True))
+    op.add_column('photos', sa.Column('mime_type', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('photos', 'mime_type')
+    op.drop_column('photos', 'content_hash')
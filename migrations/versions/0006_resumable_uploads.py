@@ -0,0 +1,45 @@
+"""Возобновляемые загрузки uploads
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'uploads',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('idempotency_key', sa.String(), nullable=True),
+        sa.Column('filename', sa.String(), nullable=False),
+        sa.Column('length', sa.BigInteger(), nullable=False),
+        sa.Column('offset', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('status', sa.String(), nullable=False, server_default='uploading'),
+        sa.Column('photo_id', sa.Integer(), nullable=True),
+        sa.Column('task_id', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('uq_uploads_idempotency', 'uploads', ['user_id', 'idempotency_key'], unique=True)
+    active = sa.text("status != 'finalized'")
+    op.create_index(
+        'ix_uploads_expires', 'uploads', ['expires_at'],
+        postgresql_where=active, sqlite_where=active
+    )
+
+
+def downgrade():
+    op.drop_index('ix_uploads_expires', table_name='uploads')
+    op.drop_index('uq_uploads_idempotency', table_name='uploads')
+    op.drop_table('uploads')
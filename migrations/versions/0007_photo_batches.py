@@ -0,0 +1,41 @@
+"""Пакетные загрузки photo_batches и photos.batch_id
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'photo_batches',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('group_id', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    with op.batch_alter_table('photos') as batch:
+        batch.add_column(sa.Column('batch_id', sa.String(), nullable=True))
+        batch.create_foreign_key(
+            'photos_batch_id_fkey', 'photo_batches', ['batch_id'], ['id'], ondelete='SET NULL'
+        )
+    op.create_index('ix_photos_batch_id', 'photos', ['batch_id'])
+
+
+def downgrade():
+    op.drop_index('ix_photos_batch_id', table_name='photos')
+    with op.batch_alter_table('photos') as batch:
+        batch.drop_constraint('photos_batch_id_fkey', type_='foreignkey')
+        batch.drop_column('batch_id')
+    op.drop_table('photo_batches')
@@ -0,0 +1,35 @@
+"""Время обработки фото, удаление исходников по сроку хранения, индекс по url
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('photos', sa.Column('processed_at', sa.DateTime(), nullable=True))
+    op.add_column('photos', sa.Column('original_deleted_at', sa.DateTime(), nullable=True))
+    # Для уже обработанных фото точное время неизвестно, отсчитываем срок от загрузки
+    op.execute('UPDATE photos SET processed_at = timestamp WHERE "isProcessed" = true')
+
+    kept = sa.text('original_deleted_at IS NULL')
+    op.create_index('ix_photos_url', 'photos', ['url'])
+    op.create_index(
+        'ix_photos_retention', 'photos', ['processed_at', 'id'],
+        postgresql_where=kept, sqlite_where=kept
+    )
+
+
+def downgrade():
+    op.drop_index('ix_photos_retention', table_name='photos')
+    op.drop_index('ix_photos_url', table_name='photos')
+    op.drop_column('photos', 'original_deleted_at')
+    op.drop_column('photos', 'processed_at')
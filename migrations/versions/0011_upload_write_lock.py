@@ -0,0 +1,24 @@
+"""Захват записи возобновляемой загрузки: токен PATCH и срок его действия
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('uploads', sa.Column('write_token', sa.String(), nullable=True))
+    op.add_column('uploads', sa.Column('write_locked_until', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('uploads', 'write_locked_until')
+    op.drop_column('uploads', 'write_token')
@@ -0,0 +1,109 @@
+"""
+Локальное окружение для бенчмарков: SQLite, временные ключи JWT, хранилище во временном
+каталоге, Celery без Redis и детектор-заглушка вместо весов YOLO.
+
+Настройки читаются модулями src при импорте, поэтому prepare() вызывается до импорта src
+"""
+import io
+import os
+import tempfile
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+ROOT = Path(__file__).parent.parent
+
+
+def _write_keys(workdir: Path):
+    # ES256: подпись быстрее RSA, на результаты бенчмарка меньше влияет генерация токенов
+    key = ec.generate_private_key(ec.SECP256R1())
+    private_path, public_path = workdir / 'jwt_private.pem', workdir / 'jwt_public.pem'
+    private_path.write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ))
+    public_path.write_bytes(key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ))
+    return private_path, public_path
+
+
+def prepare(workdir: Path = None) -> Path:
+    """
+    Создает рабочий каталог с базой и ключами и выставляет переменные окружения.
+    Уже заданные DB_URL и JWT_* не перезаписываются: можно прогнать бенчмарк на PostgreSQL
+    """
+    workdir = Path(workdir or tempfile.mkdtemp(prefix='clearphoto-bench-'))
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.environ.setdefault('DB_URL', f"sqlite:///{workdir / 'bench.sqlite'}")
+    if 'JWT_PRIVATE_KEY' not in os.environ:
+        private_path, public_path = _write_keys(workdir)
+        os.environ['JWT_PRIVATE_KEY'] = str(private_path)
+        os.environ['JWT_PUBLIC_KEY'] = str(public_path)
+    os.environ.setdefault('STORAGE_BACKEND', 'local')
+    os.environ.setdefault('STORAGE_ROOT', str(workdir / 'storage'))
+    # bcrypt с рабочей стоимостью съел бы все время регистрации и логина
+    os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+    config = Config(str(ROOT / 'alembic.ini'))
+    config.set_main_option('script_location', str(ROOT / 'migrations'))
+    command.upgrade(config, 'head')
+    return workdir
+
+
+def configure_celery(mode: str):
+    """
+    eager - задачи выполняются прямо в запросе, который их ставит;
+    worker - брокер в памяти и воркер в отдельном потоке этого процесса.
+    Для worker возвращает контекстный менеджер, запускающий воркер
+    """
+    from src.ml.celery_app import celery_app
+
+    celery_app.conf.update(broker_url='memory://', result_backend='cache+memory://')
+    if mode == 'eager':
+        celery_app.conf.update(task_always_eager=True, task_store_eager_result=True)
+        return None
+    from celery.contrib.testing.worker import start_worker
+    return start_worker(celery_app, pool='solo', perform_ping_check=False)
+
+
+class _Box:
+    def __init__(self, x1, y1, x2, y2):
+        self.cls = [0]
+        self.conf = [0.9]
+        self.xyxy = [[x1, y1, x2, y2]]
+
+
+class _Result:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+def stub_model(image, verbose=False):
+    """Детектор-заглушка: одно "лицо" в центре кадра, чтобы размытие тоже попадало в замер"""
+    h, w = image.shape[:2]
+    return [_Result([_Box(w * 2 // 5, h * 2 // 5, w * 3 // 5, h * 3 // 5)])]
+
+
+def use_stub_model():
+    import src.ml.tasks as tasks
+
+    tasks.get_model = lambda: stub_model
+
+
+def disable_mail():
+    """Письма регистрации остаются в outbox, отправитель не будится"""
+    import src.routers.auth as auth_router
+
+    auth_router.notify_email_outbox = lambda: None
+
+
+def sample_jpeg(width: int = 1280, height: int = 720, seed: int = 0) -> bytes:
+    from PIL import Image
+
+    image = Image.effect_noise((width, height), 64 + seed % 64).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
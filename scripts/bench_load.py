@@ -0,0 +1,195 @@
+"""
+Нагрузочный прогон API на локальных заменах (scripts/bench_env.py): приложение
+поднимается в этом же процессе через uvicorn, каждый виртуальный пользователь
+проходит сценарий регистрация -> логин -> пакетная загрузка -> ожидание обработки ->
+получение результатов -> список фото. Печатает p50/p99 по шагам и пропускную способность.
+
+    python -m scripts.bench_load --users 8 --photos 5 --celery eager
+    python -m scripts.bench_load --celery worker --json bench_load.json
+"""
+import argparse
+import json
+import socket
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts.bench_env import prepare, configure_celery, use_stub_model, disable_mail, sample_jpeg
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Recorder:
+    """Время и ошибки запросов по шагам сценария; используется из нескольких потоков"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, step: str, func, *args, expect: int = 200, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            response = func(*args, **kwargs)
+            ok = response.status_code == expect
+        except Exception as e:
+            print(f"{step}: {e}")
+            response, ok = None, False
+        elapsed = time.perf_counter() - started_at
+        with self._lock:
+            self.latencies[step].append(elapsed)
+            if not ok:
+                self.errors[step] += 1
+        return response if ok else None
+
+    def summary(self, wall_seconds: float) -> dict:
+        steps = {}
+        for step, values in self.latencies.items():
+            steps[step] = {
+                'requests': len(values),
+                'errors': self.errors[step],
+                'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+                'mean_ms': round(statistics.fmean(values) * 1000, 2),
+            }
+        total = sum(len(values) for values in self.latencies.values())
+        return {
+            'wall_seconds': round(wall_seconds, 2),
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'requests_per_second': round(total / wall_seconds, 2) if wall_seconds else 0,
+            'steps': steps,
+        }
+
+
+def scenario(base_url: str, recorder: Recorder, images: list, poll_timeout: float) -> bool:
+    import httpx
+
+    name = f"bench-{uuid.uuid4().hex[:12]}"
+    with httpx.Client(base_url=base_url, timeout=120) as client:
+        if not recorder.call('register', client.post, '/auth/registration',
+                             json={'login': name, 'password': 'bench-password', 'email': f'{name}@example.com'}):
+            return False
+        if not recorder.call('login', client.post, '/auth/login',
+                             json={'login': name, 'password': 'bench-password'}):
+            return False
+
+        files = [('files', (f'{index}.jpg', data, 'image/jpeg')) for index, data in enumerate(images)]
+        response = recorder.call('upload_batch', client.post, '/photo/upload/batch', files=files)
+        if response is None:
+            return False
+        batch = response.json()
+        photo_ids = [item['photo_id'] for item in batch['photos'] if item.get('photo_id')]
+
+        deadline = time.monotonic() + poll_timeout
+        while True:
+            response = recorder.call('poll_batch', client.get, f"/photo/batch/{batch['batch_id']}")
+            if response is None:
+                return False
+            if response.json()['pending'] == 0:
+                break
+            if time.monotonic() > deadline:
+                print(f"{name}: обработка не завершилась за {poll_timeout} с")
+                return False
+            time.sleep(0.05)
+
+        for photo_id in photo_ids:
+            recorder.call('fetch_result', client.get, f'/photo/result/{photo_id}')
+        return recorder.call('list_photos', client.get, '/photo/user', params={'limit': 50}) is not None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int):
+    import uvicorn
+    from src.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn не запустился")
+        time.sleep(0.05)
+    return server, thread
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=8, help='число одновременных виртуальных пользователей')
+    parser.add_argument('--iterations', type=int, default=3, help='сколько раз каждый проходит сценарий')
+    parser.add_argument('--photos', type=int, default=5, help='фото в пакетной загрузке')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--celery', choices=('eager', 'worker'), default='eager')
+    parser.add_argument('--model', choices=('stub', 'real'), default='stub',
+                        help='real - настоящие веса YOLO из src/ml/pretrainedYOLO.pt')
+    parser.add_argument('--poll-timeout', type=float, default=120)
+    parser.add_argument('--workdir', help='каталог для базы и хранилища; по умолчанию временный')
+    parser.add_argument('--json', help='записать итог в файл')
+    args = parser.parse_args()
+
+    workdir = prepare(args.workdir)
+    worker = configure_celery(args.celery)
+    if args.model == 'stub':
+        use_stub_model()
+    disable_mail()
+    images = [sample_jpeg(args.width, args.height, seed) for seed in range(args.photos)]
+
+    port = free_port()
+    server, thread = start_server(port)
+    recorder = Recorder()
+    runs = args.users * args.iterations
+    try:
+        if worker is not None:
+            worker.__enter__()
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            results = list(pool.map(
+                lambda _: scenario(f'http://127.0.0.1:{port}', recorder, images, args.poll_timeout),
+                range(runs)
+            ))
+        wall_seconds = time.perf_counter() - started_at
+    finally:
+        if worker is not None:
+            worker.__exit__(None, None, None)
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    summary = recorder.summary(wall_seconds)
+    summary.update({
+        'celery': args.celery,
+        'model': args.model,
+        'users': args.users,
+        'scenarios': runs,
+        'scenarios_failed': results.count(False),
+        'scenarios_per_second': round(runs / wall_seconds, 2),
+        'photos_per_second': round(results.count(True) * args.photos / wall_seconds, 2),
+        'workdir': str(workdir),
+    })
+
+    print(f"{'step':<16}{'requests':>10}{'errors':>8}{'p50, ms':>12}{'p99, ms':>12}{'mean, ms':>12}")
+    for step, row in summary['steps'].items():
+        print(f"{step:<16}{row['requests']:>10}{row['errors']:>8}"
+              f"{row['p50_ms']:>12.2f}{row['p99_ms']:>12.2f}{row['mean_ms']:>12.2f}")
+    print(f"{summary['requests']} запросов за {summary['wall_seconds']} с: "
+          f"{summary['requests_per_second']} запр/с, {summary['scenarios_per_second']} сценариев/с, "
+          f"{summary['photos_per_second']} фото/с, неудачных сценариев {summary['scenarios_failed']}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
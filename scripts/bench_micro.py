@@ -0,0 +1,221 @@
+"""
+Микробенчмарки горячих функций: blur_area, check_access_jwt и методы Database
+на локальной SQLite (scripts/bench_env.py). Результаты сравниваются с базовой линией
+scripts/bench_baseline.json; код возврата 1, если что-то стало медленнее допуска.
+
+    python -m scripts.bench_micro                  # сравнить с базовой линией
+    python -m scripts.bench_micro --save           # записать новую базовую линию
+    python -m scripts.bench_micro -k database      # только бенчмарки, в имени которых есть подстрока
+
+Базовая линия зависит от машины: после смены железа ее нужно перезаписать
+"""
+import argparse
+import json
+import sys
+import timeit
+from datetime import datetime
+from pathlib import Path
+
+from scripts.bench_env import prepare
+
+BASELINE_PATH = Path(__file__).parent / 'bench_baseline.json'
+
+# name -> (подготовка, возвращающая функцию без аргументов; вызовов в одном замере)
+BENCHMARKS = {}
+
+
+def benchmark(name: str, number: int):
+    def decorator(setup):
+        BENCHMARKS[name] = (setup, number)
+        return setup
+    return decorator
+
+
+@benchmark('blur_area.face_200px', number=5)
+def bench_blur_area():
+    import numpy as np
+    from src.ml.tasks import blur_area
+
+    image = np.random.default_rng(0).integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+    return lambda: blur_area(image, 540, 260, 740, 460)
+
+
+@benchmark('check_access_jwt.cold', number=200)
+def bench_jwt_cold():
+    from src.utils import auth
+
+    token = auth.create_jwt(1, 'bench')
+
+    def run():
+        auth._verified.clear()
+        auth.check_access_jwt(token)
+    return run
+
+
+@benchmark('check_access_jwt.cached', number=5000)
+def bench_jwt_cached():
+    from src.utils import auth
+
+    token = auth.create_jwt(1, 'bench')
+    auth.check_access_jwt(token)
+    return lambda: auth.check_access_jwt(token)
+
+
+def _bench_user(database, photos: int = 1000):
+    """Пользователь с photos фото; создается один раз на прогон"""
+    login = 'bench-micro'
+    user = database.get_user_auth(login)
+    if user is None:
+        user_id = database.create_user(login=login, password_hash='', email='bench-micro@example.com')
+        for start in range(0, photos, 500):
+            database.create_photos(user_id, [
+                {'url': f'originals/bench-{index}.jpg', 'size': 100000}
+                for index in range(start, min(photos, start + 500))
+            ])
+        return user_id
+    return user.id
+
+
+@benchmark('database.create_photo', number=200)
+def bench_create_photo():
+    from src.database.database import database
+
+    user_id = _bench_user(database)
+    return lambda: database.create_photo(user_id, 'originals/bench-new.jpg', size=100000)
+
+
+@benchmark('database.create_photos.50', number=20)
+def bench_create_photos():
+    from src.database.database import database
+
+    user_id = _bench_user(database)
+    items = [{'url': f'originals/bench-batch-{index}.jpg', 'size': 100000} for index in range(50)]
+    return lambda: database.create_photos(user_id, items, batch_id=None)
+
+
+@benchmark('database.get_user_photos.50', number=200)
+def bench_get_user_photos():
+    from src.database.database import database
+
+    user_id = _bench_user(database)
+    return lambda: database.get_user_photos(user_id, limit=50)
+
+
+@benchmark('database.get_photo_brief', number=1000)
+def bench_get_photo_brief():
+    from src.database.database import database
+
+    photo_id = database.get_user_photos(_bench_user(database), limit=1)[0].id
+    return lambda: database.get_photo_brief(photo_id)
+
+
+@benchmark('database.get_photo_stats', number=1000)
+def bench_get_photo_stats():
+    from src.database.database import database
+
+    user_id = _bench_user(database)
+    return lambda: database.get_photo_stats(user_id)
+
+
+@benchmark('database.update_photo_status', number=500)
+def bench_update_photo_status():
+    from src.database.database import database
+
+    user_id = _bench_user(database)
+    photo_id = database.get_user_photos(user_id, limit=1)[0].id
+    state = {'processed': False}
+
+    def run():
+        state['processed'] = not state['processed']
+        database.update_photo_status(photo_id, state['processed'], user_id=user_id)
+    return run
+
+
+@benchmark('database.get_user_auth.cached', number=5000)
+def bench_get_user_auth():
+    from src.database.database import database
+
+    _bench_user(database)
+    return lambda: database.get_user_auth('bench-micro')
+
+
+def _api_client(database):
+    """TestClient с cookie доступа пользователя бенчмарка: запрос проходит весь стек FastAPI"""
+    from fastapi.testclient import TestClient
+    from src.main import app
+    from src.utils.auth import create_jwt
+
+    client = TestClient(app)
+    client.cookies.set('access_token', create_jwt(_bench_user(database), 'bench-micro', ttl=60))
+    return client
+
+
+@benchmark('api.photo_user.1000', number=20)
+def bench_api_photo_user():
+    from src.database.database import database
+
+    client = _api_client(database)
+    return lambda: client.get('/photo/user', params={'limit': 1000}).raise_for_status()
+
+
+@benchmark('api.photo_unprocessed.1000', number=20)
+def bench_api_photo_unprocessed():
+    from src.database.database import database
+
+    client = _api_client(database)
+    return lambda: client.get('/photo/unprocessed', params={'limit': 1000}).raise_for_status()
+
+
+def measure(setup, number: int, repeat: int) -> float:
+    """Лучшее из repeat замеров среднего времени одного вызова, секунды"""
+    func = setup()
+    func()
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-k', dest='filter', default='', help='подстрока имени бенчмарка')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', action='store_true', help='записать результаты как базовую линию')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='допустимое замедление относительно базовой линии, доля')
+    parser.add_argument('--workdir', help='каталог для базы; по умолчанию временный')
+    args = parser.parse_args()
+
+    prepare(args.workdir)
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    reference = baseline.get('results', {})
+
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<34}{'us/call':>12}{'baseline':>12}{'change':>10}")
+    for name, (setup, number) in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        seconds = measure(setup, number, args.repeat)
+        results[name] = seconds
+        line = f"{name:<34}{seconds * 1e6:>12.1f}"
+        if name in reference:
+            change = seconds / reference[name] - 1
+            line += f"{reference[name] * 1e6:>12.1f}{change:>+10.0%}"
+            if change > args.tolerance:
+                regressions.append(name)
+                line += '  РЕГРЕССИЯ'
+        print(line)
+
+    if args.save:
+        baseline = {
+            'saved_at': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'results': {**reference, **results},
+        }
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+        print(f"Базовая линия записана в {BASELINE_PATH}")
+    elif regressions:
+        print(f"Медленнее базовой линии больше чем на {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Проверка числа SQL-запросов и прочитанных строк на горячих путях: логин, /auth,
+список фото, статистика, информация о фото и пакетная вставка. Запросы считаются
+событием before_cursor_execute движка, строки - курсором sqlite3, который считает
+fetch*. Работает на локальной SQLite (scripts/bench_env.py); код возврата 1, если
+число запросов или строк разошлось с ожидаемым, поэтому скрипт можно ставить в CI.
+
+    python -m scripts.check_queries
+"""
+import os
+import sqlite3
+import sys
+import uuid
+from contextlib import contextmanager
+
+from scripts.bench_env import prepare, disable_mail
+
+PHOTOS = 60
+PAGE = 50
+
+
+class Counter:
+    statements = 0
+    rows = 0
+    sql = []
+
+
+class CountingCursor(sqlite3.Cursor):
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            Counter.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        Counter.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        Counter.rows += len(rows)
+        return rows
+
+
+class CountingConnection(sqlite3.Connection):
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+
+def count_statements(conn, cursor, statement, parameters, context, executemany):
+    Counter.statements += 1
+    Counter.sql.append(' '.join(statement.split())[:100])
+
+
+@contextmanager
+def counting():
+    Counter.statements, Counter.rows, Counter.sql = 0, 0, []
+    yield Counter
+
+
+def main():
+    prepare()
+    disable_mail()
+    if not os.environ['DB_URL'].startswith('sqlite'):
+        print("Проверка работает только на SQLite: строки считает курсор sqlite3")
+        sys.exit(1)
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine, event
+    from src.database.database import database
+    from src.main import app
+    from src.utils.auth import create_jwt
+    from src.utils.utils import hash_password
+
+    # Тот же URL, но соединения с курсором, считающим строки
+    database.engine = create_engine(os.environ['DB_URL'], connect_args={'factory': CountingConnection})
+    event.listen(database.engine, 'before_cursor_execute', count_statements)
+
+    login, password = 'check-queries', 'check-password'
+    user_id = database.create_user(login=login, password_hash=hash_password(password).hex(),
+                                   email='check-queries@example.com')
+    database.create_photos(user_id, [{'url': f'originals/check-{index}.jpg', 'size': 1000}
+                                      for index in range(PHOTOS)])
+    photo_id = database.get_user_photos(user_id, limit=1)[0].id
+    batch = [{'url': f'originals/check-batch-{index}.jpg', 'size': 1000} for index in range(PAGE)]
+
+    client = TestClient(app)
+    client.cookies.set('access_token', create_jwt(user_id, login, ttl=60))
+    etag = {}
+
+    def login_request():
+        database.invalidate_user(login)
+        client.post('/auth/login', json={'login': login, 'password': password}).raise_for_status()
+
+    def list_photos():
+        response = client.get('/photo/user', params={'limit': PAGE})
+        response.raise_for_status()
+        etag['value'] = response.headers['ETag']
+
+    def list_not_modified():
+        response = client.get('/photo/user', params={'limit': PAGE}, headers={'If-None-Match': etag['value']})
+        assert response.status_code == 304, response.status_code
+
+    # имя -> (действие, ожидаемое число запросов, ожидаемое число строк)
+    checks = {
+        'POST /auth/login (промах кэша)': (login_request, 1, 1),
+        'POST /auth/login (кэш)': (
+            lambda: client.post('/auth/login', json={'login': login, 'password': password}).raise_for_status(),
+            0, 0
+        ),
+        'GET /auth (кэш)': (lambda: client.get('/auth').raise_for_status(), 0, 0),
+        f'GET /photo/user?limit={PAGE}': (list_photos, 2, 1 + PAGE + 1),
+        'GET /photo/user (304)': (list_not_modified, 1, 1),
+        'GET /photo/stats/count': (lambda: client.get('/photo/stats/count').raise_for_status(), 1, 1),
+        'GET /photo/{id}': (lambda: client.get(f'/photo/{photo_id}').raise_for_status(), 1, 1),
+        f'create_photos({PAGE}) с пакетом': (
+            lambda: database.create_photos(user_id, batch, batch_id=str(uuid.uuid4())), 3, PAGE
+        ),
+    }
+
+    failures = []
+    print(f"{'check':<36}{'statements':>12}{'expected':>10}{'rows':>8}{'expected':>10}")
+    for name, (action, statements, rows) in checks.items():
+        with counting() as counter:
+            action()
+        line = (f"{name:<36}{counter.statements:>12}{statements:>10}"
+                f"{counter.rows:>8}{rows:>10}")
+        if (counter.statements, counter.rows) != (statements, rows):
+            failures.append(name)
+            line += '  РАСХОЖДЕНИЕ'
+            line += ''.join(f"\n    {sql}" for sql in counter.sql)
+        print(line)
+
+    if failures:
+        print(f"Число запросов или строк изменилось: {', '.join(failures)}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
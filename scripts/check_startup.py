@@ -0,0 +1,80 @@
+"""
+Проверка бюджета старта API: импорт src.main в чистом процессе должен укладываться
+во время и память и не тянуть модули воркера (cv2, numpy, ultralytics/torch, src.ml.tasks).
+Код возврата 1 при нарушении, поэтому скрипт можно ставить в CI.
+
+    python -m scripts.check_startup
+    python -m scripts.check_startup --seconds 1.5 --rss-mb 150 --top 15
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from scripts.bench_env import prepare, ROOT
+
+# Модули, которые нужны только воркеру; их появление в API - регрессия
+FORBIDDEN_MODULES = ('cv2', 'numpy', 'torch', 'ultralytics', 'src.ml.tasks', 'src.ml.background')
+
+PROBE = '''
+import json, resource, sys, time
+started_at = time.perf_counter()
+import src.main
+elapsed = time.perf_counter() - started_at
+print(json.dumps({
+    'seconds': elapsed,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules': len(sys.modules),
+    'forbidden': [name for name in %r if name in sys.modules],
+}))
+'''
+
+
+def slowest_imports(stderr: str, top: int) -> list:
+    """Самые долгие импорты (с учетом вложенных) из вывода python -X importtime"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=float(os.getenv('STARTUP_BUDGET_SECONDS', 2.0)))
+    parser.add_argument('--rss-mb', type=float, default=float(os.getenv('STARTUP_BUDGET_RSS_MB', 200)))
+    parser.add_argument('--top', type=int, default=10, help='сколько самых долгих импортов показать')
+    args = parser.parse_args()
+
+    prepare()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE % (FORBIDDEN_MODULES,)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        print(completed.stderr)
+        sys.exit(1)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    print(f"import src.main: {result['seconds']:.2f} с (бюджет {args.seconds} с), "
+          f"RSS {result['rss_mb']:.0f} МБ (бюджет {args.rss_mb:.0f} МБ), модулей {result['modules']}")
+    for cumulative, name in slowest_imports(completed.stderr, args.top):
+        print(f"{cumulative / 1000:>10.1f} мс  {name}")
+
+    failures = []
+    if result['forbidden']:
+        failures.append(f"API импортирует модули воркера: {', '.join(result['forbidden'])}")
+    if result['seconds'] > args.seconds:
+        failures.append(f"старт дольше бюджета: {result['seconds']:.2f} с > {args.seconds} с")
+    if result['rss_mb'] > args.rss_mb:
+        failures.append(f"память больше бюджета: {result['rss_mb']:.0f} МБ > {args.rss_mb:.0f} МБ")
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
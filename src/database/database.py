@@ -1,12 +1,33 @@
 import os
+from collections import defaultdict
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, select, delete
-from sqlalchemy.orm import registry, Session
-from datetime import datetime
+from sqlalchemy import create_engine, select, delete, insert, update, func, case, tuple_, literal, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import registry, Session, raiseload
+from datetime import datetime, timedelta
+from typing import NamedTuple
 
-from src.database.models import AbstractModel, UserModel, ProcessPhotoModel
-from src.utils.utils import hash_password
+from src.database.models import UserModel, ProcessPhotoModel, PhotoStatsModel, EmailOutboxModel, \
+    UploadSessionModel, PhotoBatchModel
+from src.utils.cache import TTLCache
+from src.utils.metrics import instrument_engine
+from src.utils.tracing import trace_engine
+
+
+class UserSnapshot(NamedTuple):
+    """Компактная копия строки users для кэша: не привязана к сессии"""
+    id: int
+    login: str
+    email: str
+    password: str
+    verify: bool
+
+
+# Отметка в кэше для логина, которого нет в базе
+_NO_USER = object()
+# Промах живет в кэше недолго: регистрацию в другом процессе API сбрасывает только его собственный кэш
+USER_CACHE_MISS_TTL = float(os.getenv('USER_CACHE_MISS_TTL', 5))
 
 class Database:
 
@@ -20,256 +41,916 @@ class Database:
             pool_pre_ping=True,
             pool_recycle=3600,
         )
+        instrument_engine(self.engine)
+        trace_engine(self.engine)
         self.mapped_registry = registry()
-        self._session = None
-        with Session(self.engine) as session:
-            AbstractModel.metadata.create_all(self.engine)
-
-    @property
-    def session(self):
-        if self._session is None:
-            self._session = Session(self.engine)
-        return self._session
-
-    def _ensure_session(self):
-        try:
-            self.session.execute(select(1)).scalar()
-            return self.session
-        except Exception as e:
-            print(f"⚠️ Ошибка соединения: {e}, пересоздаю сессию...")
-            # Создаем новую сессию
-            if self._session:
-                try:
-                    self._session.close()
-                except:
-                    pass
-            self._session = Session(self.engine)
-            return self.session
-
-    def add(self, obj):
-        session = self._ensure_session()
-        try:
-            session.add(obj)
-            session.commit()
-        except Exception as e:
-            print(f"⚠️ Ошибка при добавлении: {e}, пробую еще раз...")
-            session.rollback()
-            if self._session:
-                try:
-                    self._session.close()
-                except:
-                    pass
-            self._session = Session(self.engine)
-            self._session.add(obj)
-            self._session.commit()
-
-    def create_user(self, login: str, password: str, email: str):
-        session = self._ensure_session()
-        try:
-            res = session.execute(select(UserModel.login).where(UserModel.login == login))
-            user = res.scalar()
-            if user is not None:
-                return False
-            else:
-                res = session.execute(select(UserModel.id).order_by(UserModel.id.desc()))
-                id = res.scalar()
-                print(id)
-                if id:
-                    user = UserModel(id=(id + 1), login=login, email=email, password=hash_password(password).hex(),
-                                     verify=False)
-                else:
-                    user = UserModel(id=1, login=login, email=email, password=hash_password(password).hex(),
-                                     verify=False)
-                self.add(user)
+        # Кэш пользователей по логину для /auth и логина; сбрасывается при изменении строки
+        self.user_cache = TTLCache(
+            maxsize=int(os.getenv('USER_CACHE_SIZE', 10000)),
+            ttl=float(os.getenv('USER_CACHE_TTL', 300))
+        )
+        # Схема создается и обновляется миграциями: alembic upgrade head
+
+    def _insert(self, model):
+        """INSERT с поддержкой ON CONFLICT для текущего диалекта"""
+        if self.engine.dialect.name == 'sqlite':
+            return sqlite.insert(model)
+        return postgresql.insert(model)
+
+    def _bump_stats(self, session, user_id: int, total: int = 0, processed: int = 0,
+                    pending: int = 0, bytes: int = 0):
+        """
+        Инкрементально меняет счетчики пользователя в текущей транзакции
+        и увеличивает версию его фото (ETag списков и статистики)
+        """
+        stmt = self._insert(PhotoStatsModel).values(
+            user_id=user_id, total=total, processed=processed, pending=pending, bytes=bytes, version=1
+        )
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=[PhotoStatsModel.user_id],
+            set_={
+                'total': PhotoStatsModel.total + stmt.excluded.total,
+                'processed': PhotoStatsModel.processed + stmt.excluded.processed,
+                'pending': PhotoStatsModel.pending + stmt.excluded.pending,
+                'bytes': PhotoStatsModel.bytes + stmt.excluded.bytes,
+                'version': PhotoStatsModel.version + 1,
+            }
+        ))
+
+    def new_session(self):
+        """
+        Своя сессия на каждый вызов метода: методы зовутся из пула потоков параллельно,
+        а одна общая сессия не потокобезопасна. Объекты не истекают после commit,
+        поэтому возвращенные записи читаются и после закрытия сессии.
+        Разорванные соединения отбрасывает пул (pool_pre_ping)
+        """
+        return Session(self.engine, expire_on_commit=False)
+
+    def create_user(self, login: str, password_hash: str, email: str):
+        """
+        Создает пользователя одним INSERT ... ON CONFLICT DO NOTHING RETURNING id.
+        Возвращает id нового пользователя или None, если login или email уже заняты
+        """
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    self._insert(UserModel)
+                    .values(login=login, email=email, password=password_hash, verify=False)
+                    .on_conflict_do_nothing()
+                    .returning(UserModel.id)
+                )
+                user_id = res.scalar()
+                session.commit()
+                self.invalidate_user(login)
+                return user_id
+            except Exception as e:
+                print(f"Ошибка в create_user: {e}")
+                session.rollback()
+                return None
+
+    def delete_user(self, user_id: int):
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    delete(UserModel).where(UserModel.id == user_id).returning(UserModel.login)
+                )
+                login = res.scalar()
+                session.commit()
+                if login is None:
+                    return False
+                self.invalidate_user(login)
                 return True
-        except Exception as e:
-            print(f"Ошибка в create_user: {e}")
-            return False
+            except Exception as e:
+                print(f"Ошибка в delete_user: {e}")
+                session.rollback()
+                return False
+
+    def update_password(self, user_id: int, password_hash: str):
+        """Меняет хеш пароля; False, если пользователя нет или запрос не удался"""
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    update(UserModel).where(UserModel.id == user_id).values(password=password_hash)
+                    .returning(UserModel.login)
+                )
+                login = res.scalar()
+                session.commit()
+                if login is not None:
+                    self.invalidate_user(login)
+                return login is not None
+            except Exception as e:
+                print(f"Ошибка в update_password: {e}")
+                session.rollback()
+                return False
 
     def check_email(self, email):
-        session = self._ensure_session()
-        try:
-            res = session.execute(select(UserModel).where(UserModel.email == email))
-            user = res.scalar()
-            return user is None
-        except Exception as e:
-            print(f"Ошибка в check_email: {e}")
-            return False
+        with self.new_session() as session:
+            try:
+                res = session.execute(select(UserModel).where(UserModel.email == email))
+                user = res.scalar()
+                return user is None
+            except Exception as e:
+                print(f"Ошибка в check_email: {e}")
+                return False
 
     def verify_email(self, email):
-        session = self._ensure_session()
-        try:
-            res = session.execute(select(UserModel).where(UserModel.email == email))
-            user = res.scalar()
-            if user:
-                user.verify = True
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    update(UserModel).where(UserModel.email == email).values(verify=True)
+                    .returning(UserModel.login)
+                )
+                login = res.scalar()
                 session.commit()
+                if login is None:
+                    return False
+                self.invalidate_user(login)
                 return True
-            return False
-        except Exception as e:
-            print(f"Ошибка в verify_email: {e}")
-            return False
+            except Exception as e:
+                print(f"Ошибка в verify_email: {e}")
+                session.rollback()
+                return False
 
     def get_user(self, login):
-        session = self._ensure_session()
-        try:
-            res = session.execute(select(UserModel).where(UserModel.login == login))
-            user = res.scalar()
-            return user
-        except Exception as e:
-            print(f"Ошибка при получении пользователя: {e}")
-            if self._session:
-                try:
-                    self._session.close()
-                except:
-                    pass
-            self._session = Session(self.engine)
-            try:
-                res = self._session.execute(select(UserModel).where(UserModel.login == login))
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    select(UserModel).where(UserModel.login == login).options(raiseload(UserModel.photos))
+                )
+                user = res.scalar()
+                return user
+            except Exception as e:
+                print(f"Ошибка при получении пользователя: {e}")
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    select(UserModel).where(UserModel.login == login).options(raiseload(UserModel.photos))
+                )
                 return res.scalar()
             except Exception as e2:
                 print(f"Повторная ошибка: {e2}")
                 return None
 
-    def create_photo(self, user_id: int, url: str):
-        session = self._ensure_session()
-        try:
-            res = session.execute(select(ProcessPhotoModel.id).order_by(ProcessPhotoModel.id.desc()))
-            last_id = res.scalar()
-            new_id = last_id + 1 if last_id else 1
+    def get_user_auth(self, login):
+        """
+        Легкая проекция пользователя для горячих путей авторизации.
+        Читается через кэш: в базу идет только промах
+        """
+        cached = self.user_cache.get(login)
+        if cached is not None:
+            return None if cached is _NO_USER else cached
 
-            photo = ProcessPhotoModel(
-                id=new_id, timestamp=datetime.now(),
-                url=url, isProcessed=False, user_id=user_id
-            )
-            self.add(photo)
-            return photo
-        except Exception as e:
-            print(f"Ошибка в create_photo: {e}")
-            return None
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    select(UserModel.id, UserModel.login, UserModel.email, UserModel.password, UserModel.verify)
+                    .where(UserModel.login == login)
+                )
+                row = res.first()
+            except Exception as e:
+                print(f"Ошибка при получении пользователя: {e}")
+                session.rollback()
+                return None
+            user = UserSnapshot(*row) if row is not None else None
+            if user is not None:
+                self.user_cache.set(login, user)
+            else:
+                self.user_cache.set(login, _NO_USER, ttl=USER_CACHE_MISS_TTL)
+            return user
+
+    def invalidate_user(self, login):
+        """Сбрасывает кэш пользователя; вызывать после любого изменения строки users"""
+        self.user_cache.pop(login)
+
+    def create_photo(self, user_id: int, url: str, size: int = 0,
+                     content_hash: str = None, mime_type: str = None,
+                     width: int = None, height: int = None):
+        with self.new_session() as session:
+            try:
+                photo = session.scalars(
+                    insert(ProcessPhotoModel)
+                    .values(timestamp=datetime.now(), url=url, isProcessed=False, user_id=user_id, size=size,
+                            content_hash=content_hash, mime_type=mime_type, width=width, height=height)
+                    .returning(ProcessPhotoModel)
+                ).one()
+                self._bump_stats(session, user_id, total=1, pending=1, bytes=size)
+                session.commit()
+                return photo
+            except Exception as e:
+                print(f"Ошибка в create_photo: {e}")
+                session.rollback()
+                return None
+
+    def create_photos(self, user_id: int, items: list[dict], batch_id: str = None):
+        """
+        Пакетная вставка фото одним INSERT ... RETURNING в одной транзакции.
+        items - словари с ключами url, size и необязательными content_hash, mime_type, width, height.
+        С batch_id в той же транзакции создается запись photo_batches.
+        Возвращает созданные записи в порядке items или пустой список при ошибке
+        """
+        if not items:
+            return []
+        with self.new_session() as session:
+            try:
+                now = datetime.now()
+                if batch_id is not None:
+                    session.execute(
+                        insert(PhotoBatchModel)
+                        .values(id=batch_id, user_id=user_id, total=len(items), created_at=now)
+                    )
+                # Без sort_by_parameter_order: на SQLite он дробит вставку на INSERT на каждую строку.
+                # Порядок items восстанавливается по url - у каждого фото свой ключ в хранилище
+                photos = session.scalars(
+                    insert(ProcessPhotoModel).returning(ProcessPhotoModel),
+                    [
+                        {
+                            'timestamp': now, 'url': item['url'], 'isProcessed': False, 'user_id': user_id,
+                            'size': item.get('size', 0), 'content_hash': item.get('content_hash'),
+                            'mime_type': item.get('mime_type'), 'width': item.get('width'),
+                            'height': item.get('height'), 'batch_id': batch_id
+                        }
+                        for item in items
+                    ]
+                ).all()
+                by_url = defaultdict(list)
+                for photo in photos:
+                    by_url[photo.url].append(photo)
+                photos = [by_url[item['url']].pop() for item in items]
+                total_bytes = sum(item.get('size', 0) for item in items)
+                self._bump_stats(session, user_id, total=len(photos), pending=len(photos), bytes=total_bytes)
+                session.commit()
+                return photos
+            except Exception as e:
+                print(f"Ошибка в create_photos: {e}")
+                session.rollback()
+                return []
 
     def get_photo(self, photo_id: int):
-        session = self._ensure_session()
-        try:
-            res = session.execute(
-                select(ProcessPhotoModel).where(ProcessPhotoModel.id == photo_id)
-            )
-            photo = res.scalar()
-            return photo
-        except Exception as e:
-            print(f"Ошибка при получении фото {photo_id}: {e}")
-            if self._session:
-                try:
-                    self._session.close()
-                except:
-                    pass
-            self._session = Session(self.engine)
-            try:
-                res = self._session.execute(
-                    select(ProcessPhotoModel).where(ProcessPhotoModel.id == photo_id)
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    select(ProcessPhotoModel)
+                    .where(ProcessPhotoModel.id == photo_id)
+                    .options(raiseload(ProcessPhotoModel.user))
+                )
+                photo = res.scalar()
+                return photo
+            except Exception as e:
+                print(f"Ошибка при получении фото {photo_id}: {e}")
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    select(ProcessPhotoModel)
+                    .where(ProcessPhotoModel.id == photo_id)
+                    .options(raiseload(ProcessPhotoModel.user))
                 )
                 return res.scalar()
             except Exception as e2:
                 print(f"Повторная ошибка: {e2}")
                 return None
 
-    def get_user_photos(self, user_id: int, limit: int = 100, offset: int = 0):
-        session = self._ensure_session()
-        try:
-            res = session.execute(
-                select(ProcessPhotoModel)
-                .where(ProcessPhotoModel.user_id == user_id)
-                .order_by(ProcessPhotoModel.timestamp.desc())
-                .limit(limit)
-                .offset(offset)
-            )
-            photos = res.scalars().all()
-            return photos
-        except Exception as e:
-            print(f"Ошибка при получении фото пользователя {user_id}: {e}")
-            if self._session:
-                try:
-                    self._session.close()
-                except:
-                    pass
-            self._session = Session(self.engine)
-            try:
-                res = self._session.execute(
-                    select(ProcessPhotoModel)
-                    .where(ProcessPhotoModel.user_id == user_id)
-                    .order_by(ProcessPhotoModel.timestamp.desc())
-                    .limit(limit)
-                    .offset(offset)
+    def get_photo_brief(self, photo_id: int):
+        """Проекция фото для проверок владельца и выдачи файла, без загрузки пользователя"""
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    select(
+                        ProcessPhotoModel.id, ProcessPhotoModel.user_id, ProcessPhotoModel.url,
+                        ProcessPhotoModel.isProcessed, ProcessPhotoModel.timestamp, ProcessPhotoModel.mime_type,
+                        ProcessPhotoModel.width, ProcessPhotoModel.height
+                    ).where(ProcessPhotoModel.id == photo_id)
                 )
-                return res.scalars().all()
+                return res.first()
+            except Exception as e:
+                print(f"Ошибка при получении фото {photo_id}: {e}")
+                session.rollback()
+                return None
+
+    def get_user_photos(self, user_id: int, limit: int = 100, offset: int = 0,
+                        processed: bool = None, after: tuple = None):
+        """
+        Фото пользователя от новых к старым: строки (id, url, isProcessed, timestamp)
+        без загрузки ORM-объектов, списки страниц сериализуются прямо из них.
+        after - ключ (timestamp, id) последнего фото предыдущей страницы (keyset-пагинация),
+        processed - фильтр по статусу обработки, применяется в SQL
+        """
+        query = (
+            select(
+                ProcessPhotoModel.id, ProcessPhotoModel.url,
+                ProcessPhotoModel.isProcessed, ProcessPhotoModel.timestamp
+            )
+            .where(ProcessPhotoModel.user_id == user_id)
+            .order_by(ProcessPhotoModel.timestamp.desc(), ProcessPhotoModel.id.desc())
+            .limit(limit)
+        )
+        if processed is not None:
+            query = query.where(ProcessPhotoModel.isProcessed == processed)
+        if after is not None:
+            query = query.where(tuple_(ProcessPhotoModel.timestamp, ProcessPhotoModel.id) < tuple_(*after))
+        elif offset:
+            query = query.offset(offset)
+
+        with self.new_session() as session:
+            try:
+                res = session.execute(query)
+                return res.all()
+            except Exception as e:
+                print(f"Ошибка при получении фото пользователя {user_id}: {e}")
+        with self.new_session() as session:
+            try:
+                res = session.execute(query)
+                return res.all()
             except Exception as e2:
                 print(f"Повторная ошибка: {e2}")
                 return []
 
     def get_unprocessed_photos(self, limit: int = 10):
-        session = self._ensure_session()
-        try:
-            res = session.execute(
-                select(ProcessPhotoModel)
-                .where(ProcessPhotoModel.isProcessed == False)
-                .order_by(ProcessPhotoModel.timestamp.asc())
-                .limit(limit)
-            )
-            photos = res.scalars().all()
-            return photos
-        except Exception as e:
-            print(f"Ошибка при получении необработанных фото: {e}")
+        """Очередь необработанных фото, строки со столбцами PhotoInfo"""
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    select(
+                        ProcessPhotoModel.id, ProcessPhotoModel.url, ProcessPhotoModel.user_id,
+                        ProcessPhotoModel.isProcessed, ProcessPhotoModel.timestamp,
+                        ProcessPhotoModel.width, ProcessPhotoModel.height
+                    )
+                    .where(ProcessPhotoModel.isProcessed == False)
+                    .order_by(ProcessPhotoModel.timestamp.asc())
+                    .limit(limit)
+                )
+                return res.all()
+            except Exception as e:
+                print(f"Ошибка при получении необработанных фото: {e}")
+                return []
+
+    def update_photo_status(self, photo_id: int, isProcessed: bool = True, user_id: int = None,
+                            result_saved: bool = False):
+        """
+        Меняет статус одним UPDATE; с user_id обновляется только фото этого пользователя.
+        processed_at (от него считается срок хранения исходника) ставится только с result_saved=True -
+        когда воркер записал результат обработки; отметка пользователем его не ставит.
+        Возвращает True, если фото (с учетом владельца) существует
+        """
+        owned = [ProcessPhotoModel.id == photo_id]
+        if user_id is not None:
+            owned.append(ProcessPhotoModel.user_id == user_id)
+        values = {'isProcessed': isProcessed}
+        if not isProcessed:
+            values['processed_at'] = None
+        elif result_saved:
+            values['processed_at'] = datetime.now()
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    update(ProcessPhotoModel)
+                    .where(*owned, ProcessPhotoModel.isProcessed != isProcessed)
+                    .values(**values)
+                    .returning(ProcessPhotoModel.user_id)
+                )
+                user_id = res.scalar()
+                if user_id is None:
+                    # Статус уже такой (или фото нет) - счетчики не трогаем
+                    exists = session.execute(select(ProcessPhotoModel.id).where(*owned)).scalar()
+                    if exists is not None and result_saved:
+                        # Фото уже отметил пользователь: время обработки ставит только воркер
+                        session.execute(
+                            update(ProcessPhotoModel)
+                            .where(*owned, ProcessPhotoModel.processed_at.is_(None))
+                            .values(processed_at=values['processed_at'])
+                        )
+                    session.commit()
+                    return exists is not None
+
+                delta = 1 if isProcessed else -1
+                self._bump_stats(session, user_id, processed=delta, pending=-delta)
+                session.commit()
+                return True
+            except Exception as e:
+                print(f"Ошибка при обновлении статуса фото {photo_id}: {e}")
+                session.rollback()
+                return False
+
+    def delete_photo(self, photo_id: int, user_id: int = None):
+        """
+        Удаляет фото одним DELETE ... RETURNING; с user_id удаляется только фото этого пользователя.
+        Возвращает удаленную запись (id, user_id, url, isProcessed, size) или None
+        """
+        rows = self.delete_photos([photo_id], user_id)
+        return rows[0] if rows else None
+
+    def delete_photos(self, photo_ids: list[int], user_id: int = None):
+        """Удаляет фото (с user_id - только этого пользователя) одним DELETE, возвращает удаленные записи"""
+        if not photo_ids:
             return []
+        owned = [ProcessPhotoModel.id.in_(photo_ids)]
+        if user_id is not None:
+            owned.append(ProcessPhotoModel.user_id == user_id)
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    delete(ProcessPhotoModel)
+                    .where(*owned)
+                    .returning(
+                        ProcessPhotoModel.id, ProcessPhotoModel.user_id, ProcessPhotoModel.url,
+                        ProcessPhotoModel.isProcessed, ProcessPhotoModel.size
+                    )
+                )
+                rows = res.all()
 
-    def update_photo_status(self, photo_id: int, isProcessed: bool = True):
-        session = self._ensure_session()
-        try:
-            res = session.execute(
-                select(ProcessPhotoModel).where(ProcessPhotoModel.id == photo_id)
-            )
-            photo = res.scalar()
+                by_user = {}
+                for row in rows:
+                    counters = by_user.setdefault(row.user_id, {'total': 0, 'processed': 0, 'pending': 0, 'bytes': 0})
+                    counters['total'] -= 1
+                    counters['processed' if row.isProcessed else 'pending'] -= 1
+                    counters['bytes'] -= row.size
+                for owner_id, counters in by_user.items():
+                    self._bump_stats(session, owner_id, **counters)
+                session.commit()
+                return rows
+            except Exception as e:
+                print(f"Ошибка при удалении фото {photo_ids}: {e}")
+                session.rollback()
+                return []
+
+    def get_photo_stats(self, user_id: int):
+        """
+        Счетчики и версия фото пользователя из photo_stats: один SELECT по первичному ключу.
+        version None - прочитать не удалось, условные ответы по ней давать нельзя
+        """
+        with self.new_session() as session:
+            try:
+                stats = session.get(PhotoStatsModel, user_id, populate_existing=True)
+                if stats is None:
+                    return {'total': 0, 'processed': 0, 'pending': 0, 'bytes': 0, 'version': 0}
+                return {
+                    'total': stats.total,
+                    'processed': stats.processed,
+                    'pending': stats.pending,
+                    'bytes': stats.bytes,
+                    'version': stats.version
+                }
+            except Exception as e:
+                print(f"Ошибка при получении статистики {user_id}: {e}")
+                return {'total': 0, 'processed': 0, 'pending': 0, 'bytes': 0, 'version': None}
+
+    def get_photos_count(self, user_id: int = None):
+        with self.new_session() as session:
+            try:
+                if user_id:
+                    return self.get_photo_stats(user_id)['total']
+
+                res = session.execute(select(func.coalesce(func.sum(PhotoStatsModel.total), 0)))
+                return res.scalar()
+            except Exception as e:
+                print(f"Ошибка при подсчете фото: {e}")
+                return 0
+
+    def reconcile_photo_stats(self):
+        """
+        Пересчитывает photo_stats по таблице photos (страховка от дрейфа счетчиков).
+        Возвращает число пользователей, для которых записаны счетчики
+        """
+        with self.new_session() as session:
+            try:
+                aggregated = (
+                    select(
+                        ProcessPhotoModel.user_id,
+                        func.count(ProcessPhotoModel.id),
+                        func.sum(case((ProcessPhotoModel.isProcessed == True, 1), else_=0)),
+                        func.sum(case((ProcessPhotoModel.isProcessed == True, 0), else_=1)),
+                        func.coalesce(func.sum(ProcessPhotoModel.size), 0),
+                        literal(1),
+                    )
+                    .group_by(ProcessPhotoModel.user_id)
+                )
+                stmt = self._insert(PhotoStatsModel).from_select(
+                    ['user_id', 'total', 'processed', 'pending', 'bytes', 'version'], aggregated
+                )
+                # Версия растет только у исправленных строк, чтобы не сбрасывать ETag всем пользователям
+                session.execute(stmt.on_conflict_do_update(
+                    index_elements=[PhotoStatsModel.user_id],
+                    set_={
+                        'total': stmt.excluded.total,
+                        'processed': stmt.excluded.processed,
+                        'pending': stmt.excluded.pending,
+                        'bytes': stmt.excluded.bytes,
+                        'version': PhotoStatsModel.version + 1,
+                    },
+                    where=or_(
+                        PhotoStatsModel.total != stmt.excluded.total,
+                        PhotoStatsModel.processed != stmt.excluded.processed,
+                        PhotoStatsModel.pending != stmt.excluded.pending,
+                        PhotoStatsModel.bytes != stmt.excluded.bytes,
+                    )
+                ))
+                # Пользователи, у которых фото больше нет
+                session.execute(
+                    update(PhotoStatsModel)
+                    .where(
+                        PhotoStatsModel.user_id.not_in(select(ProcessPhotoModel.user_id).distinct()),
+                        or_(PhotoStatsModel.total != 0, PhotoStatsModel.processed != 0,
+                            PhotoStatsModel.pending != 0, PhotoStatsModel.bytes != 0)
+                    )
+                    .values(total=0, processed=0, pending=0, bytes=0, version=PhotoStatsModel.version + 1)
+                )
+                count = session.execute(select(func.count()).select_from(PhotoStatsModel)).scalar()
+                session.commit()
+                return count
+            except Exception as e:
+                print(f"Ошибка при пересчете статистики фото: {e}")
+                session.rollback()
+                return 0
+
+    def enqueue_email(self, receiver: str, subject: str, body: str):
+        """Кладет письмо в email_outbox, возвращает id записи или None"""
+        with self.new_session() as session:
+            try:
+                now = datetime.now()
+                res = session.execute(
+                    insert(EmailOutboxModel)
+                    .values(receiver=receiver, subject=subject, body=body, status='pending',
+                            attempts=0, next_attempt_at=now, created_at=now)
+                    .returning(EmailOutboxModel.id)
+                )
+                email_id = res.scalar()
+                session.commit()
+                return email_id
+            except Exception as e:
+                print(f"Ошибка в enqueue_email: {e}")
+                session.rollback()
+                return None
+
+    def claim_outbox_batch(self, limit: int = 50, lease_seconds: int = 300):
+        """
+        Забирает пачку писем, готовых к отправке. Забранные письма откладываются на lease_seconds,
+        так что параллельный отправитель их не возьмет, а после падения отправителя они вернутся в очередь
+        """
+        with self.new_session() as session:
+            try:
+                now = datetime.now()
+                due = (
+                    select(EmailOutboxModel.id)
+                    .where(EmailOutboxModel.status == 'pending', EmailOutboxModel.next_attempt_at <= now)
+                    .order_by(EmailOutboxModel.next_attempt_at)
+                    .limit(limit)
+                    .with_for_update(skip_locked=True)
+                )
+                res = session.execute(
+                    update(EmailOutboxModel)
+                    .where(EmailOutboxModel.id.in_(due.scalar_subquery()))
+                    .values(
+                        attempts=EmailOutboxModel.attempts + 1,
+                        next_attempt_at=now + timedelta(seconds=lease_seconds)
+                    )
+                    .returning(EmailOutboxModel.id, EmailOutboxModel.receiver, EmailOutboxModel.subject,
+                               EmailOutboxModel.body, EmailOutboxModel.attempts)
+                )
+                batch = res.all()
+                session.commit()
+                return batch
+            except Exception as e:
+                print(f"Ошибка в claim_outbox_batch: {e}")
+                session.rollback()
+                return []
 
-            if photo:
-                photo.isProcessed = isProcessed
+    def mark_emails_sent(self, email_ids: list[int]):
+        if not email_ids:
+            return True
+        with self.new_session() as session:
+            try:
+                session.execute(
+                    update(EmailOutboxModel)
+                    .where(EmailOutboxModel.id.in_(email_ids))
+                    .values(status='sent', sent_at=datetime.now(), last_error=None)
+                )
                 session.commit()
                 return True
-            return False
-        except Exception as e:
-            print(f"Ошибка при обновлении статуса фото {photo_id}: {e}")
-            session.rollback()
-            return False
-
-    def delete_photo(self, photo_id: int):
-        session = self._ensure_session()
-        try:
-            res = session.execute(
-                select(ProcessPhotoModel).where(ProcessPhotoModel.id == photo_id)
-            )
-            photo = res.scalar()
+            except Exception as e:
+                print(f"Ошибка в mark_emails_sent: {e}")
+                session.rollback()
+                return False
 
-            if photo:
-                session.delete(photo)
+    def mark_email_failed(self, email_id: int, error: str, retry_at: datetime = None):
+        """Неудачная попытка: retry_at - время следующей попытки, None - больше не пытаться"""
+        with self.new_session() as session:
+            try:
+                values = {'last_error': error[:1000]}
+                if retry_at is None:
+                    values['status'] = 'failed'
+                else:
+                    values['next_attempt_at'] = retry_at
+                session.execute(update(EmailOutboxModel).where(EmailOutboxModel.id == email_id).values(**values))
                 session.commit()
                 return True
-            return False
-        except Exception as e:
-            print(f"Ошибка при удалении фото {photo_id}: {e}")
-            session.rollback()
-            return False
+            except Exception as e:
+                print(f"Ошибка в mark_email_failed: {e}")
+                session.rollback()
+                return False
+
+    def create_upload(self, upload_id: str, user_id: int, filename: str, length: int,
+                      idempotency_key: str = None, ttl: timedelta = timedelta(hours=24)):
+        """
+        Создает возобновляемую загрузку. С тем же idempotency_key возвращает уже существующую.
+        Возвращает (строка uploads, создана ли она сейчас) или (None, False) при ошибке
+        """
+        with self.new_session() as session:
+            try:
+                now = datetime.now()
+                res = session.execute(
+                    self._insert(UploadSessionModel)
+                    .values(id=upload_id, user_id=user_id, idempotency_key=idempotency_key, filename=filename,
+                            length=length, offset=0, status='uploading', created_at=now, expires_at=now + ttl)
+                    .on_conflict_do_nothing()
+                    .returning(*UploadSessionModel.__table__.columns)
+                )
+                upload = res.first()
+                created = upload is not None
+                if not created and idempotency_key is not None:
+                    upload = session.execute(
+                        select(*UploadSessionModel.__table__.columns).where(
+                            UploadSessionModel.user_id == user_id,
+                            UploadSessionModel.idempotency_key == idempotency_key
+                        )
+                    ).first()
+                session.commit()
+                return upload, created
+            except Exception as e:
+                print(f"Ошибка в create_upload: {e}")
+                session.rollback()
+                return None, False
+
+    def get_upload(self, upload_id: str, user_id: int):
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    select(*UploadSessionModel.__table__.columns).where(
+                        UploadSessionModel.id == upload_id, UploadSessionModel.user_id == user_id
+                    )
+                )
+                return res.first()
+            except Exception as e:
+                print(f"Ошибка в get_upload {upload_id}: {e}")
+                session.rollback()
+                return None
+
+    def _upload_write_free(self, now: datetime):
+        return or_(UploadSessionModel.write_token.is_(None), UploadSessionModel.write_locked_until < now)
+
+    def claim_upload_write(self, upload_id: str, user_id: int, offset: int, token: str,
+                           lease: timedelta = timedelta(minutes=30)):
+        """
+        Захватывает запись в загрузку до того, как PATCH начнет писать в файл: только один из
+        параллельных запросов с тем же offset получает True. Захват, брошенный дольше lease, перехватывается
+        """
+        with self.new_session() as session:
+            try:
+                now = datetime.now()
+                res = session.execute(
+                    update(UploadSessionModel)
+                    .where(UploadSessionModel.id == upload_id, UploadSessionModel.user_id == user_id,
+                           UploadSessionModel.offset == offset, UploadSessionModel.status == 'uploading',
+                           self._upload_write_free(now))
+                    .values(write_token=token, write_locked_until=now + lease)
+                    .returning(UploadSessionModel.id)
+                )
+                claimed = res.scalar() is not None
+                session.commit()
+                return claimed
+            except Exception as e:
+                print(f"Ошибка в claim_upload_write {upload_id}: {e}")
+                session.rollback()
+                return False
+
+    def advance_upload(self, upload_id: str, token: str, new_offset: int,
+                       ttl: timedelta = timedelta(hours=24)):
+        """Сдвигает offset и снимает захват записи; False, если захват уже перехвачен другим запросом"""
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    update(UploadSessionModel)
+                    .where(UploadSessionModel.id == upload_id, UploadSessionModel.write_token == token,
+                           UploadSessionModel.status == 'uploading')
+                    .values(offset=new_offset, expires_at=datetime.now() + ttl,
+                            write_token=None, write_locked_until=None)
+                    .returning(UploadSessionModel.id)
+                )
+                updated = res.scalar() is not None
+                session.commit()
+                return updated
+            except Exception as e:
+                print(f"Ошибка в advance_upload {upload_id}: {e}")
+                session.rollback()
+                return False
+
+    def _set_upload_status(self, upload_id: str, user_id: int, old_status: str, new_status: str,
+                           require_complete: bool = False):
+        with self.new_session() as session:
+            try:
+                query = update(UploadSessionModel).where(
+                    UploadSessionModel.id == upload_id, UploadSessionModel.user_id == user_id,
+                    UploadSessionModel.status == old_status
+                )
+                if require_complete:
+                    query = query.where(UploadSessionModel.offset == UploadSessionModel.length,
+                                        self._upload_write_free(datetime.now()))
+                res = session.execute(query.values(status=new_status).returning(UploadSessionModel.id))
+                updated = res.scalar() is not None
+                session.commit()
+                return updated
+            except Exception as e:
+                print(f"Ошибка при смене статуса загрузки {upload_id}: {e}")
+                session.rollback()
+                return False
+
+    def claim_upload_finalize(self, upload_id: str, user_id: int):
+        """Только один из параллельных запросов финализации получает True"""
+        return self._set_upload_status(upload_id, user_id, 'uploading', 'finalizing', require_complete=True)
+
+    def release_upload_finalize(self, upload_id: str, user_id: int):
+        return self._set_upload_status(upload_id, user_id, 'finalizing', 'uploading')
+
+    def complete_upload(self, upload_id: str, user_id: int, url: str, size: int,
+                        content_hash: str = None, mime_type: str = None,
+                        width: int = None, height: int = None):
+        """Создает фото и помечает загрузку finalized в одной транзакции"""
+        with self.new_session() as session:
+            try:
+                photo = session.scalars(
+                    insert(ProcessPhotoModel)
+                    .values(timestamp=datetime.now(), url=url, isProcessed=False, user_id=user_id, size=size,
+                            content_hash=content_hash, mime_type=mime_type, width=width, height=height)
+                    .returning(ProcessPhotoModel)
+                ).one()
+                self._bump_stats(session, user_id, total=1, pending=1, bytes=size)
+                session.execute(
+                    update(UploadSessionModel)
+                    .where(UploadSessionModel.id == upload_id, UploadSessionModel.status == 'finalizing')
+                    .values(status='finalized', photo_id=photo.id)
+                )
+                session.commit()
+                return photo
+            except Exception as e:
+                print(f"Ошибка в complete_upload {upload_id}: {e}")
+                session.rollback()
+                return None
+
+    def claim_upload_dispatch(self, upload_id: str, task_id: str):
+        """Записывает task_id, если задача обработки еще не ставилась: так она ставится ровно один раз"""
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    update(UploadSessionModel)
+                    .where(UploadSessionModel.id == upload_id, UploadSessionModel.status == 'finalized',
+                           UploadSessionModel.task_id.is_(None))
+                    .values(task_id=task_id)
+                    .returning(UploadSessionModel.id)
+                )
+                claimed = res.scalar() is not None
+                session.commit()
+                return claimed
+            except Exception as e:
+                print(f"Ошибка в claim_upload_dispatch {upload_id}: {e}")
+                session.rollback()
+                return False
+
+    def release_upload_dispatch(self, upload_id: str):
+        """Постановка задачи не удалась: следующий запрос финализации повторит ее"""
+        with self.new_session() as session:
+            try:
+                session.execute(
+                    update(UploadSessionModel).where(UploadSessionModel.id == upload_id).values(task_id=None)
+                )
+                session.commit()
+                return True
+            except Exception as e:
+                print(f"Ошибка в release_upload_dispatch {upload_id}: {e}")
+                session.rollback()
+                return False
+
+    def expire_uploads(self, limit: int = 1000):
+        """Удаляет незавершенные загрузки с истекшим сроком, возвращает их id"""
+        with self.new_session() as session:
+            try:
+                expired = (
+                    select(UploadSessionModel.id)
+                    .where(UploadSessionModel.status != 'finalized', UploadSessionModel.expires_at < datetime.now())
+                    .limit(limit)
+                )
+                res = session.execute(
+                    delete(UploadSessionModel)
+                    .where(UploadSessionModel.id.in_(expired.scalar_subquery()))
+                    .returning(UploadSessionModel.id)
+                )
+                upload_ids = res.scalars().all()
+                session.commit()
+                return upload_ids
+            except Exception as e:
+                print(f"Ошибка в expire_uploads: {e}")
+                session.rollback()
+                return []
+
+    def existing_photo_urls(self, urls: list[str]) -> set:
+        """Какие из url принадлежат фото; по ним сборщик мусора отличает живые объекты от сирот"""
+        if not urls:
+            return set()
+        with self.new_session() as session:
+            try:
+                res = session.execute(select(ProcessPhotoModel.url).where(ProcessPhotoModel.url.in_(urls)))
+                existing = set(res.scalars().all())
+                session.commit()
+                return existing
+            except Exception as e:
+                print(f"Ошибка в existing_photo_urls: {e}")
+                session.rollback()
+                # Без ответа БД считаем все объекты живыми, чтобы ничего не удалить по ошибке
+                return set(urls)
+
+    def get_expired_originals(self, processed_before: datetime, after_id: int = 0, limit: int = 500):
+        """Обработанные до processed_before фото, исходники которых еще не удалены: (id, url)"""
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    select(ProcessPhotoModel.id, ProcessPhotoModel.url)
+                    .where(
+                        ProcessPhotoModel.original_deleted_at.is_(None),
+                        ProcessPhotoModel.processed_at < processed_before,
+                        ProcessPhotoModel.id > after_id
+                    )
+                    .order_by(ProcessPhotoModel.id)
+                    .limit(limit)
+                )
+                rows = res.all()
+                session.commit()
+                return rows
+            except Exception as e:
+                print(f"Ошибка в get_expired_originals: {e}")
+                session.rollback()
+                return []
+
+    def mark_originals_deleted(self, photo_ids: list[int]):
+        if not photo_ids:
+            return True
+        with self.new_session() as session:
+            try:
+                session.execute(
+                    update(ProcessPhotoModel)
+                    .where(ProcessPhotoModel.id.in_(photo_ids))
+                    .values(original_deleted_at=datetime.now())
+                )
+                session.commit()
+                return True
+            except Exception as e:
+                print(f"Ошибка в mark_originals_deleted: {e}")
+                session.rollback()
+                return False
+
+    def set_batch_group(self, batch_id: str, group_id: str):
+        with self.new_session() as session:
+            try:
+                session.execute(update(PhotoBatchModel).where(PhotoBatchModel.id == batch_id).values(group_id=group_id))
+                session.commit()
+                return True
+            except Exception as e:
+                print(f"Ошибка в set_batch_group {batch_id}: {e}")
+                session.rollback()
+                return False
+
+    def delete_batch(self, batch_id: str):
+        """Удаляет запись пакета; его фото удаляются отдельно через delete_photos"""
+        with self.new_session() as session:
+            try:
+                session.execute(delete(PhotoBatchModel).where(PhotoBatchModel.id == batch_id))
+                session.commit()
+                return True
+            except Exception as e:
+                print(f"Ошибка в delete_batch {batch_id}: {e}")
+                session.rollback()
+                return False
+
+    def get_batch_progress(self, batch_id: str, user_id: int):
+        """
+        Прогресс пакета одним запросом по индексу photos.batch_id:
+        (total, group_id, created_at, photos, processed) или None, если пакета нет
+        """
+        with self.new_session() as session:
+            try:
+                res = session.execute(
+                    select(
+                        PhotoBatchModel.total, PhotoBatchModel.group_id, PhotoBatchModel.created_at,
+                        func.count(ProcessPhotoModel.id).label('photos'),
+                        func.coalesce(func.sum(case((ProcessPhotoModel.isProcessed == True, 1), else_=0)), 0)
+                        .label('processed'),
+                    )
+                    .outerjoin(ProcessPhotoModel, ProcessPhotoModel.batch_id == PhotoBatchModel.id)
+                    .where(PhotoBatchModel.id == batch_id, PhotoBatchModel.user_id == user_id)
+                    .group_by(PhotoBatchModel.id)
+                )
+                return res.first()
+            except Exception as e:
+                print(f"Ошибка в get_batch_progress {batch_id}: {e}")
+                session.rollback()
+                return None
 
-    def get_photos_count(self, user_id: int = None):
-        session = self._ensure_session()
-        try:
-            query = select(ProcessPhotoModel)
-            if user_id:
-                query = query.where(ProcessPhotoModel.user_id == user_id)
-
-            res = session.execute(query)
-            count = len(res.scalars().all())
-            return count
-        except Exception as e:
-            print(f"Ошибка при подсчете фото: {e}")
-            return 0
 
 load_dotenv()
 URL = os.getenv('DB_URL')
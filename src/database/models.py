@@ -1,5 +1,6 @@
 from sqlalchemy.orm import DeclarativeBase, relationship
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, BigInteger, Index
+from typing import Optional
 from sqlalchemy.orm import mapped_column, Mapped
 from datetime import datetime
 
@@ -11,13 +12,16 @@ class AbstractModel(DeclarativeBase):
 class UserModel(AbstractModel):
     __tablename__ = 'users'
     id: Mapped[int] = mapped_column(autoincrement=True, primary_key=True, unique=True)
-    login: Mapped[str] = mapped_column(primary_key=True)
+    login: Mapped[str] = mapped_column()
     email: Mapped[str] = mapped_column(unique=True)
     password: Mapped[str] = mapped_column()
     verify: Mapped[bool] = mapped_column()
 
 
-    photos: Mapped[list["ProcessPhotoModel"]] = relationship(back_populates="user", lazy=False)
+    # Связи не грузятся неявно: стратегия загрузки задается в каждом запросе
+    photos: Mapped[list["ProcessPhotoModel"]] = relationship(back_populates="user", lazy="raise")
+Index('uq_users_login', UserModel.login, unique=True)
+
 
 class ProcessPhotoModel(AbstractModel):
     __tablename__ = 'photos'
@@ -26,8 +30,122 @@ class ProcessPhotoModel(AbstractModel):
     url: Mapped[str] = mapped_column()
     isProcessed: Mapped[bool] = mapped_column()
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
+    size: Mapped[int] = mapped_column(BigInteger, default=0, server_default='0')
+    content_hash: Mapped[Optional[str]] = mapped_column()
+    mime_type: Mapped[Optional[str]] = mapped_column()
+    # Размеры после нормализации при загрузке, по ним можно планировать обработку
+    width: Mapped[Optional[int]] = mapped_column()
+    height: Mapped[Optional[int]] = mapped_column()
+    processed_at: Mapped[Optional[datetime]] = mapped_column()
+    # Исходник удален политикой хранения, остался только результат обработки
+    original_deleted_at: Mapped[Optional[datetime]] = mapped_column()
+    batch_id: Mapped[Optional[str]] = mapped_column(ForeignKey('photo_batches.id', ondelete='SET NULL'))
+
+
+    user: Mapped["UserModel"] = relationship(back_populates="photos", lazy="raise")
+
+
+class PhotoBatchModel(AbstractModel):
+    """Пакетная загрузка: все фото вставляются одной транзакцией и обрабатываются одной группой Celery"""
+    __tablename__ = 'photo_batches'
+    id: Mapped[str] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'))
+    total: Mapped[int] = mapped_column()
+    group_id: Mapped[Optional[str]] = mapped_column()
+    created_at: Mapped[datetime] = mapped_column()
+
+
+Index('ix_photos_batch_id', ProcessPhotoModel.batch_id)
+# Сверка хранилища с таблицей: какие из ключей еще принадлежат фото
+Index('ix_photos_url', ProcessPhotoModel.url)
+# Обработанные фото, исходники которых еще хранятся, по времени обработки
+Index(
+    'ix_photos_retention',
+    ProcessPhotoModel.processed_at, ProcessPhotoModel.id,
+    postgresql_where=ProcessPhotoModel.original_deleted_at.is_(None),
+    sqlite_where=ProcessPhotoModel.original_deleted_at.is_(None),
+)
+
+# Ключ keyset-пагинации /photo/user: (timestamp, id) в пределах пользователя
+Index(
+    'ix_photos_user_timestamp',
+    ProcessPhotoModel.user_id, ProcessPhotoModel.timestamp.desc(), ProcessPhotoModel.id.desc()
+)
+# Частичные индексы только по необработанным фото: их мало, а запрашиваются они часто
+Index(
+    'ix_photos_user_pending',
+    ProcessPhotoModel.user_id, ProcessPhotoModel.timestamp.desc(), ProcessPhotoModel.id.desc(),
+    postgresql_where=ProcessPhotoModel.isProcessed == False,
+    sqlite_where=ProcessPhotoModel.isProcessed == False,
+)
+Index(
+    'ix_photos_pending',
+    ProcessPhotoModel.timestamp,
+    postgresql_where=ProcessPhotoModel.isProcessed == False,
+    sqlite_where=ProcessPhotoModel.isProcessed == False,
+)
+
+
+class PhotoStatsModel(AbstractModel):
+    """Счетчики фото пользователя, обновляются в одной транзакции с изменением photos"""
+    __tablename__ = 'photo_stats'
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    total: Mapped[int] = mapped_column(default=0, server_default='0')
+    processed: Mapped[int] = mapped_column(default=0, server_default='0')
+    pending: Mapped[int] = mapped_column(default=0, server_default='0')
+    bytes: Mapped[int] = mapped_column(BigInteger, default=0, server_default='0')
+    # Растет при каждом изменении фото пользователя; ETag списков и статистики
+    version: Mapped[int] = mapped_column(BigInteger, default=0, server_default='0')
+
+
+class EmailOutboxModel(AbstractModel):
+    """Исходящие письма: пишутся в запросе, отправляются фоновой задачей deliver_email_outbox"""
+    __tablename__ = 'email_outbox'
+    id: Mapped[int] = mapped_column(autoincrement=True, primary_key=True)
+    receiver: Mapped[str] = mapped_column()
+    subject: Mapped[str] = mapped_column()
+    body: Mapped[str] = mapped_column()
+    # pending - ждет отправки, sent - отправлено, failed - попытки исчерпаны
+    status: Mapped[str] = mapped_column(default='pending', server_default='pending')
+    attempts: Mapped[int] = mapped_column(default=0, server_default='0')
+    next_attempt_at: Mapped[datetime] = mapped_column()
+    created_at: Mapped[datetime] = mapped_column()
+    sent_at: Mapped[Optional[datetime]] = mapped_column()
+    last_error: Mapped[Optional[str]] = mapped_column()
+
+
+Index(
+    'ix_email_outbox_due',
+    EmailOutboxModel.next_attempt_at,
+    postgresql_where=EmailOutboxModel.status == 'pending',
+    sqlite_where=EmailOutboxModel.status == 'pending',
+)
 
 
-    user: Mapped["UserModel"] = relationship(back_populates="photos", lazy=False)
+class UploadSessionModel(AbstractModel):
+    """Возобновляемая загрузка: файл собирается кусками PATCH, фото создается при финализации"""
+    __tablename__ = 'uploads'
+    id: Mapped[str] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'))
+    idempotency_key: Mapped[Optional[str]] = mapped_column()
+    filename: Mapped[str] = mapped_column()
+    length: Mapped[int] = mapped_column(BigInteger)
+    offset: Mapped[int] = mapped_column(BigInteger, default=0, server_default='0')
+    # uploading - принимаются куски, finalizing - идет финализация, finalized - фото создано
+    status: Mapped[str] = mapped_column(default='uploading', server_default='uploading')
+    photo_id: Mapped[Optional[int]] = mapped_column()
+    task_id: Mapped[Optional[str]] = mapped_column()
+    created_at: Mapped[datetime] = mapped_column()
+    expires_at: Mapped[datetime] = mapped_column()
+    # PATCH, который сейчас пишет в файл; после write_locked_until захват считается брошенным
+    write_token: Mapped[Optional[str]] = mapped_column()
+    write_locked_until: Mapped[Optional[datetime]] = mapped_column()
 
 
+Index('uq_uploads_idempotency', UploadSessionModel.user_id, UploadSessionModel.idempotency_key, unique=True)
+Index(
+    'ix_uploads_expires',
+    UploadSessionModel.expires_at,
+    postgresql_where=UploadSessionModel.status != 'finalized',
+    sqlite_where=UploadSessionModel.status != 'finalized',
+)
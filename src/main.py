@@ -1,13 +1,25 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-from src.routers import auth, photo_processor
+from src.routers import auth, photo_processor, resumable
+from src.utils.uploads import BodySizeLimitMiddleware, MAX_UPLOAD_SIZE, MAX_BATCH_UPLOAD_SIZE, MULTIPART_OVERHEAD
+from src.utils.metrics import HTTPMetricsMiddleware, render_metrics
+from src.utils.tracing import TracingMiddleware, setup_tracing, TRACING_EXPORTER
+from src.utils.profiling import ProfilingMiddleware, requests_enabled as profiling_enabled
 
 app = FastAPI()
 
 
 app.include_router(auth.router)
 app.include_router(photo_processor.router)
+app.include_router(resumable.router)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Метрики Prometheus; доступ к пути ограничивается на уровне прокси"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 
 origins = [
@@ -15,6 +27,15 @@ origins = [
     "http://localhost:5173"
 ]
 
+# Слишком большие загрузки отклоняются до разбора multipart
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={
+        '/photo/upload': MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD,
+        '/photo/upload/batch': MAX_BATCH_UPLOAD_SIZE,
+    }
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -23,5 +44,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# При выключенной трассировке middleware не добавляется вовсе
+setup_tracing('photo-api')
+if TRACING_EXPORTER != 'none':
+    app.add_middleware(TracingMiddleware)
+
+# Профилирование по заголовку X-Profile: PROFILE_TOKEN или по выборке: PROFILE_SAMPLE_RATE.
+# Если не задано ни то ни другое, middleware не добавляется
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+
+# Добавлен последним, поэтому внешний: время запроса учитывает все остальные middleware,
+# включая трассировку и профилирование
+app.add_middleware(HTTPMetricsMiddleware)
+
 if __name__ == "__main__":
     uvicorn.run("main:app")
\ No newline at end of file
@@ -0,0 +1,99 @@
+# ml/background.py
+import os
+from datetime import datetime, timedelta
+
+from celery.utils.log import get_task_logger
+
+from src.ml.celery_app import celery_app
+from src.ml.client import DELIVER_EMAIL_OUTBOX_TASK
+from src.database.database import database
+from src.utils.mailer import create_mailer
+from src.utils.storage import storage
+from src.utils.storage_gc import StorageCollector
+from src.utils.uploads import partial_path
+
+logger = get_task_logger(__name__)
+
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', 50))
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', 5))
+EMAIL_RETRY_BASE_SECONDS = int(os.getenv('EMAIL_RETRY_BASE_SECONDS', 30))
+
+# SMTP-соединение живет между запусками задачи в рамках процесса воркера
+_mailer = None
+
+
+def get_mailer():
+    global _mailer
+    if _mailer is None:
+        _mailer = create_mailer()
+    return _mailer
+
+
+@celery_app.task(name='reconcile_photo_stats')
+def reconcile_photo_stats():
+    """
+    Периодическая сверка счетчиков photo_stats с таблицей photos
+    """
+    users = database.reconcile_photo_stats()
+    logger.info(f"Счетчики фото пересчитаны для {users} пользователей")
+    return {'users': users}
+
+
+@celery_app.task(name=DELIVER_EMAIL_OUTBOX_TASK)
+def deliver_email_outbox():
+    """
+    Отправляет письма из email_outbox пачками через одно SMTP-соединение.
+    Неудачные письма откладываются с экспоненциальной задержкой
+    """
+    mailer = get_mailer()
+    sent = failed = 0
+    while True:
+        batch = database.claim_outbox_batch(EMAIL_BATCH_SIZE)
+        if not batch:
+            break
+        delivered = []
+        for email in batch:
+            try:
+                mailer.send(email.receiver, email.subject, email.body)
+                delivered.append(email.id)
+            except Exception as e:
+                failed += 1
+                mailer.close()
+                retry_at = None
+                if email.attempts < EMAIL_MAX_ATTEMPTS:
+                    retry_at = datetime.now() + timedelta(seconds=EMAIL_RETRY_BASE_SECONDS * 2 ** (email.attempts - 1))
+                logger.warning(f"Письмо {email.id} не отправлено (попытка {email.attempts}): {e}")
+                database.mark_email_failed(email.id, str(e), retry_at)
+        database.mark_emails_sent(delivered)
+        sent += len(delivered)
+        if len(batch) < EMAIL_BATCH_SIZE:
+            break
+    if sent or failed:
+        logger.info(f"Отправлено писем: {sent}, ошибок: {failed}")
+    return {'sent': sent, 'failed': failed}
+
+
+@celery_app.task(name='expire_uploads')
+def expire_uploads():
+    """
+    Удаляет возобновляемые загрузки, в которые давно ничего не дописывали, вместе с их файлами
+    """
+    upload_ids = database.expire_uploads()
+    for upload_id in upload_ids:
+        partial_path(upload_id).unlink(missing_ok=True)
+    if upload_ids:
+        logger.info(f"Удалено просроченных загрузок: {len(upload_ids)}")
+    return {'expired': len(upload_ids)}
+
+
+@celery_app.task(name='collect_storage_garbage')
+def collect_storage_garbage(dry_run: bool = None):
+    """
+    Сверяет хранилище с таблицей photos: удаляет объекты без фото, брошенные файлы
+    загрузок и исходники с истекшим сроком хранения. Разовый прогон без удаления:
+    celery -A src.ml.celery_app call collect_storage_garbage --kwargs '{"dry_run": true}'
+    """
+    options = {} if dry_run is None else {'dry_run': dry_run}
+    result = StorageCollector(storage, database, logger, **options).run()
+    logger.info(f"Сборка мусора хранилища: {result}")
+    return result
@@ -1,5 +1,16 @@
 from celery import Celery
+from celery.signals import before_task_publish, task_prerun, task_postrun, worker_init, worker_process_shutdown
+from celery.utils.log import get_task_logger
 import os
+import time
+
+from src.utils.metrics import (
+    MULTIPROCESS, TASK_QUEUE_WAIT_SECONDS, TASK_SECONDS, metrics_registry,
+)
+from src.utils.tracing import setup_tracing, inject_headers, start_remote_span, end_remote_span
+from src.utils.profiling import profiling_active, should_profile_task, start_profiler, save_profile, new_profile_id
+
+logger = get_task_logger(__name__)
 
 # Создаем экземпляр Celery
 celery_app = Celery(
@@ -20,7 +31,102 @@ celery_app.conf.update(
     task_soft_time_limit=25 * 60,  # 25 минут
     task_ignore_result=False,  # Не игнорировать результаты
     result_expires=3600,  # Результаты хранятся 1 час
+    beat_schedule={
+        'reconcile-photo-stats': {
+            'task': 'reconcile_photo_stats',
+            'schedule': 60 * 60,  # раз в час
+        },
+        'deliver-email-outbox': {
+            'task': 'deliver_email_outbox',
+            'schedule': 30,  # повторные попытки и письма, о которых воркер не узнал сразу
+        },
+        'expire-uploads': {
+            'task': 'expire_uploads',
+            'schedule': 15 * 60,
+        },
+        'collect-storage-garbage': {
+            'task': 'collect_storage_garbage',
+            'schedule': 6 * 60 * 60,
+        },
+    },
 )
 
 # Автоматически находим задачи
-celery_app.autodiscover_tasks(['src.ml.tasks'])
\ No newline at end of file
+celery_app.autodiscover_tasks(['src.ml.tasks', 'src.ml.background'])
+
+
+# Порт, на котором воркер отдает метрики Prometheus; пусто - не отдавать
+WORKER_METRICS_PORT = os.getenv('WORKER_METRICS_PORT')
+
+
+def _message_header(request, name: str):
+    """Пользовательский заголовок сообщения: в протоколе Celery 2 он становится атрибутом request"""
+    return getattr(request, name, None) or (request.headers or {}).get(name)
+
+
+@before_task_publish.connect
+def stamp_headers(headers=None, **kwargs):
+    """
+    Время постановки задачи и контекст трассы едут в заголовках сообщения:
+    воркер считает ожидание в очереди и продолжает трассу того, кто поставил задачу.
+    Задачи, поставленные профилируемым запросом, тоже профилируются
+    """
+    if headers is not None:
+        headers.setdefault('enqueued_at', time.time())
+        inject_headers(headers)
+        if profiling_active.get():
+            headers['profile'] = True
+
+
+@task_prerun.connect
+def start_task(task_id=None, task=None, **kwargs):
+    task.request.metrics_started_at = time.perf_counter()
+    enqueued_at = _message_header(task.request, 'enqueued_at')
+    if enqueued_at:
+        TASK_QUEUE_WAIT_SECONDS.labels(task.name).observe(max(0.0, time.time() - enqueued_at))
+
+    carrier = {
+        name: value for name in ('traceparent', 'tracestate')
+        if (value := _message_header(task.request, name))
+    }
+    task.request.trace_span = start_remote_span(f"celery.run {task.name}", carrier, **{
+        'celery.task_name': task.name,
+        'celery.task_id': task_id or '',
+    })
+
+    if should_profile_task(_message_header(task.request, 'profile')):
+        task.request.profiler = start_profiler()
+
+
+@task_postrun.connect
+def finish_task(task=None, state=None, **kwargs):
+    started_at = getattr(task.request, 'metrics_started_at', None)
+    if started_at is not None:
+        TASK_SECONDS.labels(task.name, state or 'UNKNOWN').observe(time.perf_counter() - started_at)
+
+    trace_span = getattr(task.request, 'trace_span', None)
+    if trace_span is not None:
+        span, token = trace_span
+        end_remote_span(span, token, error=state == 'FAILURE')
+        task.request.trace_span = None
+
+    profiler = getattr(task.request, 'profiler', None)
+    if profiler is not None:
+        task.request.profiler = None
+        path = save_profile(profiler, new_profile_id(), 'task', task.name)
+        logger.info(f"Профиль задачи {task.request.id}: {path}")
+
+
+@worker_init.connect
+def start_exporters(**kwargs):
+    setup_tracing('photo-worker')
+    if WORKER_METRICS_PORT:
+        from prometheus_client import start_http_server
+        start_http_server(int(WORKER_METRICS_PORT), registry=metrics_registry())
+
+
+@worker_process_shutdown.connect
+def cleanup_metrics(pid=None, **kwargs):
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -0,0 +1,52 @@
+# ml/client.py
+# Постановка задач воркеру по имени. API импортирует только этот модуль: src.ml.tasks
+# тянет cv2, numpy и ultralytics/torch, которые нужны лишь процессу воркера
+import uuid
+
+from celery import group
+
+from src.ml.celery_app import celery_app
+from src.utils.storage import processed_key
+
+# Имена задач; ими же регистрируются задачи в src.ml.tasks и src.ml.background
+PROCESS_IMAGE_TASK = 'process_image_with_yolo'
+DELIVER_EMAIL_OUTBOX_TASK = 'deliver_email_outbox'
+
+
+def processing_signature(key: str, photo_id: int, task_id: str = None):
+    """
+    Сигнатура задачи обработки фото; воркер читает исходник и пишет результат
+    processed/blurred_<имя файла> через хранилище. task_id можно задать заранее,
+    чтобы знать его до постановки задачи
+    """
+    return celery_app.signature(
+        PROCESS_IMAGE_TASK,
+        kwargs={
+            'image_path': key,
+            'output_path': processed_key(key),
+            'photo_id': photo_id,
+            'blur_faces': True,
+            'blur_plates': True
+        },
+        task_id=task_id or str(uuid.uuid4())
+    )
+
+
+def enqueue_processing(key: str, photo_id: int, task_id: str = None):
+    return processing_signature(key, photo_id, task_id).apply_async()
+
+
+def enqueue_group(signatures: list):
+    """Ставит задачи одной группой Celery, возвращает id группы"""
+    result = group(signatures).apply_async()
+    return result.id
+
+
+def enqueue_email_delivery():
+    """Будит отправителя писем из email_outbox; сами письма остаются в таблице до отправки"""
+    return celery_app.send_task(DELIVER_EMAIL_OUTBOX_TASK, retry=False, ignore_result=True)
+
+
+def task_result(task_id: str):
+    return celery_app.AsyncResult(task_id)
+
@@ -1,25 +1,48 @@
 # ml/tasks.py
-import os
+import io
 import cv2
 import numpy as np
 from pathlib import Path
-from ultralytics import YOLO
 from celery.utils.log import get_task_logger
+from opentelemetry import trace
 import traceback
+from contextlib import contextmanager
 
 # Импортируем экземпляр celery из соседнего файла
 from src.ml.celery_app import celery_app
+from src.ml.client import PROCESS_IMAGE_TASK
+from src.database.database import database
+from src.utils.storage import storage, processed_key
+from src.utils.metrics import PROCESSING_STAGE_SECONDS, BLUR_BOX_SECONDS, DETECTIONS_PER_IMAGE
+from src.utils.tracing import tracer
 
 logger = get_task_logger(__name__)
 
+
+@contextmanager
+def stage(name: str):
+    """Этап обработки: гистограмма длительности и дочерний спан задачи"""
+    with tracer.start_as_current_span(f"photo.{name}"), PROCESSING_STAGE_SECONDS.labels(name).time():
+        yield
+
+
+@contextmanager
+def blur_box(kind: str):
+    with tracer.start_as_current_span('photo.blur', attributes={'photo.detection': kind}), \
+            BLUR_BOX_SECONDS.labels(kind).time():
+        yield
+
+
 # Глобальная переменная для модели (синглтон)
 _model = None
 
 
 def get_model():
-    """Ленивая загрузка модели YOLO"""
+    """Ленивая загрузка модели YOLO; ultralytics/torch импортируются только здесь"""
     global _model
     if _model is None:
+        from ultralytics import YOLO
+
         # Путь к модели относительно текущего файла
         current_dir = Path(__file__).parent
         model_path = current_dir / 'pretrainedYOLO.pt'
@@ -132,13 +155,17 @@ def blur_area(image, x1, y1, x2, y2, kernel_size=(99, 99), sigma=30, feather_rat
 
     return image
 
-@celery_app.task(bind=True, name='process_image_with_yolo')
-def process_image_with_yolo(self, image_path: str, output_path: str = None,
+@celery_app.task(bind=True, name=PROCESS_IMAGE_TASK)
+def process_image_with_yolo(self, image_path: str, output_path: str = None, photo_id: int = None,
                             blur_faces: bool = True, blur_plates: bool = True):
     """
-    Celery задача для обработки одного изображения YOLO моделью
+    Celery задача для обработки одного изображения YOLO моделью.
+    image_path и output_path - ключи объектов в хранилище: исходник читается,
+    а результат записывается потоком, общий диск с API не нужен
     """
     task_id = self.request.id
+    if photo_id is not None:
+        trace.get_current_span().set_attribute('photo.id', photo_id)
     logger.info(f"[{task_id}] Запуск обработки изображения: {image_path}")
 
     try:
@@ -149,7 +176,7 @@ def process_image_with_yolo(self, image_path: str, output_path: str = None,
         )
 
         # Проверяем существование файла
-        if not os.path.exists(image_path):
+        if not storage.exists(image_path):
             error_msg = f"Изображение не найдено: {image_path}"
             logger.error(f"[{task_id}] {error_msg}")
             return {
@@ -183,9 +210,13 @@ def process_image_with_yolo(self, image_path: str, output_path: str = None,
             meta={'progress': 30, 'status': 'Чтение изображения...'}
         )
 
-        # Читаем изображение
+        # Читаем изображение из хранилища
         try:
-            image = cv2.imread(image_path)
+            with stage('read'), storage.open(image_path) as source:
+                data = source.read()
+            with stage('decode'):
+                image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            del data
             if image is None:
                 error_msg = f"Не удалось прочитать изображение: {image_path}"
                 logger.error(f"[{task_id}] {error_msg}")
@@ -214,7 +245,8 @@ def process_image_with_yolo(self, image_path: str, output_path: str = None,
 
         # Прогоняем через YOLO
         try:
-            results = model(image, verbose=False)[0]  # Берем первый результат
+            with stage('inference'):
+                results = model(image, verbose=False)[0]  # Берем первый результат
         except Exception as e:
             error_msg = f"Ошибка детекции объектов: {str(e)}"
             logger.error(f"[{task_id}] {error_msg}")
@@ -250,15 +282,22 @@ def process_image_with_yolo(self, image_path: str, output_path: str = None,
 
                 # Размываем в зависимости от класса
                 if class_id == 0 and blur_faces:
-                    image = blur_area(image, x1, y1, x2, y2)
+                    with blur_box('face'):
+                        image = blur_area(image, x1, y1, x2, y2)
                     faces_detected += 1
                     logger.debug(f"[{task_id}] Размыто лицо: [{x1}, {y1}, {x2}, {y2}], уверенность: {confidence:.2f}")
 
                 elif class_id == 1 and blur_plates:
-                    image = blur_area(image, x1, y1, x2, y2)
+                    with blur_box('license_plate'):
+                        image = blur_area(image, x1, y1, x2, y2)
                     plates_detected += 1
                     logger.debug(f"[{task_id}] Размыт номер: [{x1}, {y1}, {x2}, {y2}], уверенность: {confidence:.2f}")
 
+        DETECTIONS_PER_IMAGE.labels('face').observe(sum(1 for d in detections if d['class'] == 'face'))
+        DETECTIONS_PER_IMAGE.labels('license_plate').observe(
+            sum(1 for d in detections if d['class'] == 'license_plate')
+        )
+
         # Обновляем статус
         self.update_state(
             state='PROCESSING',
@@ -270,16 +309,18 @@ def process_image_with_yolo(self, image_path: str, output_path: str = None,
             }
         )
 
-        # Определяем путь для сохранения результата
+        # Определяем ключ для сохранения результата
         if output_path is None:
-            input_path = Path(image_path)
-            output_dir = input_path.parent / 'processed'
-            output_dir.mkdir(exist_ok=True)
-            output_path = str(output_dir / f"blurred_{input_path.name}")
+            output_path = processed_key(image_path)
 
-        # Сохраняем результат
+        # Сохраняем результат в формате исходника
         try:
-            cv2.imwrite(output_path, image)
+            with stage('encode'):
+                ok, encoded = cv2.imencode(Path(image_path).suffix or '.jpg', image)
+            if not ok:
+                raise ValueError(f"не удалось закодировать {output_path}")
+            with stage('write'):
+                storage.put_stream(output_path, io.BytesIO(encoded.tobytes()))
             logger.info(f"[{task_id}] Результат сохранен: {output_path}")
         except Exception as e:
             error_msg = f"Ошибка сохранения результата: {str(e)}"
@@ -291,10 +332,15 @@ def process_image_with_yolo(self, image_path: str, output_path: str = None,
                 'task_id': task_id
             }
 
+        # Отмечаем фото обработанным (счетчики photo_stats обновятся в той же транзакции)
+        if photo_id is not None and not database.update_photo_status(photo_id, True, result_saved=True):
+            logger.warning(f"[{task_id}] Не удалось обновить статус фото {photo_id}")
+
         # Успешный результат
         result = {
             'success': True,
             'task_id': task_id,
+            'photo_id': photo_id,
             'input_path': image_path,
             'output_path': output_path,
             'faces_detected': faces_detected,
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from src.schemas import User, CreateUser, BadResponse, GoodResponse, VerifyRequest
 from src.utils.auth import check_access_jwt, check_refresh_jwt, create_jwt
-from src.utils.utils import generate_verify_code, send_register_email, get_hash, validate_password
+from src.utils.utils import generate_verify_code, get_hash, password_needs_rehash
+from src.utils.hashing import password_hasher, PasswordPoolOverloaded
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import JSONResponse
 from src.database.database import database
+from src.ml.client import enqueue_email_delivery
 
 router = APIRouter(
     tags=["auth"]
@@ -17,11 +20,34 @@ def get_current_user(user: dict = Depends(check_access_jwt)):
     return user
 
 
+def notify_email_outbox():
+    """Будит отправителя писем; если брокер недоступен, письмо уйдет по расписанию beat"""
+    try:
+        enqueue_email_delivery()
+    except Exception as e:
+        print(f"Не удалось поставить задачу отправки писем: {e}")
+
+
+async def _password_op(coro):
+    """Операция с bcrypt в выделенном пуле; при переполнении очереди - 503"""
+    try:
+        return await coro
+    except PasswordPoolOverloaded:
+        raise HTTPException(status_code=503, detail="Сервер перегружен, повторите попытку позже")
+
+
 @router.post("/auth/login")
-def login(user: User):
-    user_db = database.get_user(user.login)
+async def login(user: User):
+    user_db = await run_in_threadpool(database.get_user_auth, user.login)
     if user_db is not None:
-        if validate_password(user.password, user_db.password):
+        if await _password_op(password_hasher.verify(user.password, user_db.password)):
+            if password_needs_rehash(user_db.password):
+                # Стоимость bcrypt изменилась: прозрачно пересчитываем хеш, пока знаем пароль
+                new_hash = await _password_op(password_hasher.hash(user.password))
+                if not await run_in_threadpool(database.update_password, user_db.id, new_hash):
+                    # Пользователь удален после чтения из кэша
+                    database.invalidate_user(user_db.login)
+                    raise HTTPException(status_code=404, detail="Пользователь не найден")
             access = create_jwt(user_db.id, user_db.login)
             refresh = create_jwt(user_db.id, user_db.login, 14*24*60)
             content = {
@@ -37,23 +63,32 @@ def login(user: User):
 
 
 @router.post("/auth/registration")
-def register(user: CreateUser):
-    if database.get_user(user.login) is not None:
-        return BadResponse(1)
-    elif not database.check_email(user.email):
-        return BadResponse(2)
-    else:
-        verifyCode = generate_verify_code()
-        result = send_register_email(message=verifyCode, receiver=user.email)
-        if result == 0:
-            database.create_user(login=user.login, email=user.email, password=user.password)
-            hashcode = get_hash(str(verifyCode) + user.email)
-            return {
-                'hash': hashcode,
-                'resultCode': 100
-            }
-        else:
-            return BadResponse(3)
+async def register(user: CreateUser, background_tasks: BackgroundTasks):
+    password_hash = await _password_op(password_hasher.hash(user.password))
+    user_id = await run_in_threadpool(
+        database.create_user, login=user.login, email=user.email, password_hash=password_hash
+    )
+    if user_id is None:
+        # Сработало ограничение уникальности (или ошибка БД): выясняем, что занято
+        if await run_in_threadpool(database.get_user_auth, user.login) is not None:
+            return BadResponse(1)
+        elif not await run_in_threadpool(database.check_email, user.email):
+            return BadResponse(2)
+        return BadResponse(66)
+    verifyCode = generate_verify_code()
+    email_id = await run_in_threadpool(
+        database.enqueue_email, user.email, 'Регистрация в Clear Photo', str(verifyCode)
+    )
+    if email_id is None:
+        await run_in_threadpool(database.delete_user, user_id)
+        return BadResponse(3)
+    # Будим отправителя уже после ответа клиенту
+    background_tasks.add_task(notify_email_outbox)
+    hashcode = get_hash(str(verifyCode) + user.email)
+    return {
+        'hash': hashcode,
+        'resultCode': 100
+    }
 
 
 @router.post("/auth/registration/verify")
@@ -71,7 +106,7 @@ def verify_registration(request: VerifyRequest):
 def auth(user_by_access: dict = Depends(check_access_jwt),
          user_by_refresh: dict = Depends(check_refresh_jwt)):
     if user_by_access:
-        user = database.get_user(user_by_access['login'])
+        user = database.get_user_auth(user_by_access['login'])
         if not user:
             return BadResponse(5)
         content = {
@@ -81,7 +116,7 @@ def auth(user_by_access: dict = Depends(check_access_jwt),
         }
         return content
     elif user_by_refresh:
-        user = database.get_user(user_by_refresh['login'])
+        user = database.get_user_auth(user_by_refresh['login'])
         content = {
             "login": user.login,
             "email": user.email,
@@ -1,35 +1,129 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Body
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Body, Request, Query
+from fastapi.responses import RedirectResponse, ORJSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+import hashlib
+import mimetypes
 import os
 import uuid
 from pathlib import Path
-import aiofiles
-from typing import Optional
-from src.ml.tasks import process_image_with_yolo
+from typing import Optional, List
+from opentelemetry import trace
+from src.ml.client import processing_signature, enqueue_processing, enqueue_group, task_result
 from src.database.database import database
 from src.routers.auth import get_current_user
+from src.utils.utils import encode_cursor, decode_cursor
+from src.utils.delivery import file_response, etag_matches, LISTING_CACHE_CONTROL
+from src.utils.tracing import tracer
+from src.utils.thumbnails import thumbnail_cache, size_bucket, thumbnail_key
+from src.utils.storage import storage, original_key, processed_key
+from src.utils.ingest import normalize_image, ImageTooLarge
+from src.utils.uploads import (
+    save_upload, SavedUpload, UploadTooLarge, UnsupportedImage,
+    MAX_UPLOAD_SIZE, MAX_BATCH_FILES, PARTIAL_DIR, EXTENSIONS,
+)
 from src.schemas import (
-    PhotoBase, PhotoInfo,
+    PhotoInfo,
     PhotoUploadResponse, TaskStatus,
     TaskStatusProcessing, TaskStatusSuccess,
     TaskStatusFailure, TaskStatusOther,
     TaskStatusPending, UserPhotosResponse,
     UnprocessedPhotosResponse, PhotoDeleteResponse,
     PhotoStatusUpdateRequest, PhotoStatusUpdateResponse,
-    PhotoStatsResponse,
+    PhotoStatsResponse, BatchUploadItem,
+    PhotoBulkDeleteRequest, PhotoBulkDeleteResponse,
+    BatchUploadResponse, BatchProgressResponse,
 )
 
 router = APIRouter(prefix="/photo", tags=["photo"])
 
-BASE_DIR = Path(__file__).parent.parent
-UPLOAD_DIR = BASE_DIR / "uploads"
-PROCESSED_DIR = BASE_DIR / "uploads" / "processed"
+# Файл сначала принимается в PARTIAL_DIR, затем переносится в хранилище (src/utils/storage.py)
+PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+
+
+ALLOWED_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.webp']
+# Сколько фото можно удалить одним запросом /photo/bulk-delete
+MAX_BULK_DELETE = int(os.getenv('MAX_BULK_DELETE', 1000))
+
+
+async def ingest_upload(saved: SavedUpload) -> SavedUpload:
+    """Нормализация принятого файла; при отказе файл удаляется, а ошибка превращается в HTTPException"""
+    try:
+        return await run_in_threadpool(normalize_image, saved)
+    except ImageTooLarge:
+        saved.path.unlink(missing_ok=True)
+        raise HTTPException(status_code=413, detail="Слишком большое разрешение изображения")
+    except UnsupportedImage:
+        saved.path.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail="Файл должен быть изображением")
+
+
+def raise_not_accessible(photo_id: int, user_id: int):
+    """
+    Мутация с проверкой владельца не затронула фото: выясняем почему (404/403).
+    Вызывается только на этом пути, успешные запросы обходятся одним запросом к БД
+    """
+    photo = database.get_photo_brief(photo_id)
+    if not photo:
+        raise HTTPException(status_code=404, detail="Фото не найдено")
+    if photo.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Доступ запрещён")
+
+
+async def remove_photo_files(photos: list):
+    """Удаляет из хранилища исходники, результаты обработки и миниатюры удаленных фото"""
+    keys = [key for photo in photos for key in (photo.url, processed_key(photo.url))]
+    try:
+        await run_in_threadpool(storage.delete_many, keys)
+    except Exception as e:
+        print(f"Ошибка при удалении файлов {keys}: {e}")
+    await run_in_threadpool(thumbnail_cache.discard_many, [photo.id for photo in photos])
+
+
+def listing_headers(kind: str, user_id: int, version: Optional[int], params: dict = None) -> dict:
+    """
+    ETag ответа, зависящего только от фото пользователя: версия растет при загрузке,
+    завершении обработки и удалении (photo_stats.version). Разобранные параметры запроса
+    (фильтр, страница, курсор) входят в ETag хешем, чтобы ответ для одних параметров
+    не подтверждал закэшированный ответ для других
+    """
+    if version is None:
+        return {'Cache-Control': LISTING_CACHE_CONTROL}
+    tag = f"{kind}-{user_id}-{version}"
+    if params:
+        normalized = '&'.join(f"{name}={params[name]}" for name in sorted(params))
+        tag += '-' + hashlib.sha256(f"{kind}:{version}:{normalized}".encode()).hexdigest()[:16]
+    return {'ETag': f'"{tag}"', 'Cache-Control': LISTING_CACHE_CONTROL}
+
+
+def not_modified(request: Request, headers: dict) -> Optional[Response]:
+    """304 без обращения к таблице photos, если у клиента актуальная версия"""
+    if 'ETag' in headers and etag_matches(request, headers['ETag']):
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+async def store_upload(saved_path: Path, filename: str) -> str:
+    """Переносит принятый файл в хранилище, возвращает ключ объекта"""
+    key = original_key(filename)
+    try:
+        await run_in_threadpool(storage.put_file, key, saved_path)
+    finally:
+        saved_path.unlink(missing_ok=True)
+    return key
+
 
-UPLOAD_DIR.mkdir(exist_ok=True)
-PROCESSED_DIR.mkdir(exist_ok=True)
+async def discard_stored(keys: list):
+    """Удаляет из хранилища объекты загрузки, которая не состоялась"""
+    if not keys:
+        return
+    try:
+        await run_in_threadpool(storage.delete_many, keys)
+    except Exception as e:
+        print(f"Ошибка при удалении файлов {keys}: {e}")
 
 
 @router.post("/upload", response_model=PhotoUploadResponse)
+@tracer.start_as_current_span('photo.upload')
 async def upload_photo(
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user)
@@ -42,36 +136,45 @@ async def upload_photo(
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="Файл должен быть изображением")
         file_extension = Path(file.filename).suffix.lower()
-        allowed_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.webp']
-        if file_extension not in allowed_extensions:
+        if file_extension not in ALLOWED_EXTENSIONS:
             raise HTTPException(
                 status_code=400,
-                detail=f"Неподдерживаемый формат. Разрешены: {', '.join(allowed_extensions)}"
+                detail=f"Неподдерживаемый формат. Разрешены: {', '.join(ALLOWED_EXTENSIONS)}"
+            )
+        # Расширение клиента - только фильтр: имя в хранилище берется из типа, определенного по байтам
+        file_id = uuid.uuid4()
+        try:
+            saved = await save_upload(file, PARTIAL_DIR / f"{file_id}{file_extension}")
+        except UploadTooLarge:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Файл слишком большой. Максимум {MAX_UPLOAD_SIZE // (1024 * 1024)} МБ"
             )
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            content = await file.read()
-            await out_file.write(content)
+        except UnsupportedImage:
+            raise HTTPException(status_code=400, detail="Файл должен быть изображением")
+        saved = await ingest_upload(saved)
+        unique_filename = f"{file_id}{EXTENSIONS[saved.mime_type]}"
+        key = await store_upload(saved.path, unique_filename)
 
         photo = database.create_photo(
             user_id=user_id,
-            url=str(file_path)
+            url=key,
+            size=saved.size,
+            content_hash=saved.sha256,
+            mime_type=saved.mime_type,
+            width=saved.width,
+            height=saved.height
         )
         if not photo:
+            await run_in_threadpool(storage.delete, key)
             raise HTTPException(status_code=500, detail="Не удалось создать запись о фото")
 
-        output_filename = f"blurred_{unique_filename}"
-        output_path = PROCESSED_DIR / output_filename
-
-        # Запускаем Celery задачу с photo_id
-        task = process_image_with_yolo.delay(
-            image_path=str(file_path),
-            output_path=str(output_path),
-            photo_id=photo.id,
-            blur_faces=True,
-            blur_plates=True
-        )
+        # Контекст этого спана уходит в заголовках задачи, спаны воркера станут его потомками
+        span = trace.get_current_span()
+        span.set_attribute('photo.id', photo.id)
+        span.set_attribute('photo.size', saved.size)
+        task = enqueue_processing(key, photo.id)
+        span.set_attribute('celery.task_id', task.id)
 
         return PhotoUploadResponse(
             photo_id=photo.id,
@@ -88,6 +191,118 @@ async def upload_photo(
         raise HTTPException(status_code=500, detail=f"Ошибка загрузки: {str(e)}")
 
 
+@router.post("/upload/batch", response_model=BatchUploadResponse)
+async def upload_photos_batch(
+    files: List[UploadFile] = File(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Загружает альбом одним запросом: все фото создаются одной транзакцией,
+    обработка ставится одной группой Celery. Неподходящие файлы отклоняются поштучно
+    """
+    user_id = current_user['id']
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f"Слишком много файлов. Максимум {MAX_BATCH_FILES}")
+
+    items = []
+    results = []
+    for file in files:
+        result = BatchUploadItem(original_filename=file.filename or '')
+        results.append(result)
+        file_extension = Path(file.filename or '').suffix.lower()
+        if file_extension not in ALLOWED_EXTENSIONS:
+            result.error = f"Неподдерживаемый формат. Разрешены: {', '.join(ALLOWED_EXTENSIONS)}"
+            continue
+        file_id = uuid.uuid4()
+        try:
+            saved = await save_upload(file, PARTIAL_DIR / f"{file_id}{file_extension}")
+        except UploadTooLarge:
+            result.error = f"Файл слишком большой. Максимум {MAX_UPLOAD_SIZE // (1024 * 1024)} МБ"
+            continue
+        except UnsupportedImage:
+            result.error = "Файл должен быть изображением"
+            continue
+        try:
+            saved = await ingest_upload(saved)
+        except HTTPException as e:
+            result.error = e.detail
+            continue
+        unique_filename = f"{file_id}{EXTENSIONS[saved.mime_type]}"
+        try:
+            key = await store_upload(saved.path, unique_filename)
+        except Exception as e:
+            # Уже сохраненные файлы пакета иначе остались бы в хранилище без записей
+            await discard_stored([item['url'] for item in items])
+            raise HTTPException(status_code=503, detail=f"Не удалось сохранить файл: {str(e)}")
+        result.saved_as = unique_filename
+        items.append({
+            'url': key,
+            'size': saved.size,
+            'content_hash': saved.sha256,
+            'mime_type': saved.mime_type,
+            'width': saved.width,
+            'height': saved.height,
+            'result': result
+        })
+
+    batch_id = uuid.uuid4().hex
+    if not items:
+        return BatchUploadResponse(batch_id=batch_id, accepted=0, rejected=len(results), photos=results)
+
+    photos = database.create_photos(user_id, items, batch_id=batch_id)
+    if not photos:
+        await discard_stored([item['url'] for item in items])
+        raise HTTPException(status_code=500, detail="Не удалось создать записи о фото")
+
+    signatures = []
+    for item, photo in zip(items, photos):
+        signature = processing_signature(photo.url, photo.id)
+        item['result'].photo_id = photo.id
+        item['result'].task_id = signature.id
+        signatures.append(signature)
+
+    try:
+        group_id = enqueue_group(signatures)
+    except Exception as e:
+        # Без задач фото навсегда остались бы в ожидании: откатываем пакет целиком, клиент повторит загрузку
+        database.delete_photos([photo.id for photo in photos], user_id)
+        database.delete_batch(batch_id)
+        await discard_stored([item['url'] for item in items])
+        raise HTTPException(status_code=503, detail=f"Не удалось поставить обработку: {str(e)}")
+    database.set_batch_group(batch_id, group_id)
+
+    return BatchUploadResponse(
+        batch_id=batch_id,
+        group_id=group_id,
+        accepted=len(photos),
+        rejected=len(results) - len(photos),
+        photos=results
+    )
+
+
+@router.get("/batch/{batch_id}", response_model=BatchProgressResponse)
+async def get_batch_progress(
+    batch_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Суммарный прогресс обработки пакета
+    """
+    progress = database.get_batch_progress(batch_id, current_user['id'])
+    if not progress:
+        raise HTTPException(status_code=404, detail="Пакет не найден")
+
+    return BatchProgressResponse(
+        batch_id=batch_id,
+        group_id=progress.group_id,
+        total=progress.photos,
+        processed=progress.processed,
+        pending=progress.photos - progress.processed,
+        progress=progress.processed / progress.photos if progress.photos else 1.0,
+        created_at=progress.created_at
+    )
+
+
 @router.get("/task/{task_id}", response_model=TaskStatus)
 async def get_task_status(
     task_id: str,
@@ -96,7 +311,7 @@ async def get_task_status(
     """
     Получить статус обработки по ID задачи
     """
-    task = process_image_with_yolo.AsyncResult(task_id)
+    task = task_result(task_id)
 
     if task.state == 'PENDING':
         return TaskStatusPending(
@@ -115,7 +330,7 @@ async def get_task_status(
         )
     elif task.state == 'SUCCESS':
         photo_id = task.result.get('photo_id')
-        photo = database.get_photo(photo_id)
+        photo = database.get_photo_brief(photo_id)
         if not photo or photo.user_id != current_user['id']:
             raise HTTPException(status_code=403, detail="Доступ запрещён")
         return TaskStatusSuccess(
@@ -140,12 +355,51 @@ async def get_task_status(
 @router.get("/result/{photo_id}")
 async def get_processed_photo(
     photo_id: int,
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Получить обработанное фото по ID фото из БД.
+    Поддерживает If-None-Match/If-Modified-Since (304) и Range;
+    из удаленного хранилища отдается перенаправлением на подписанную ссылку
+    """
+    trace.get_current_span().set_attribute('photo.id', photo_id)
+    photo = database.get_photo_brief(photo_id)
+
+    if not photo:
+        raise HTTPException(status_code=404, detail="Фото не найдено")
+
+    if photo.user_id != current_user['id']:
+        raise HTTPException(status_code=403, detail="Доступ запрещён")
+
+    if not photo.isProcessed:
+        raise HTTPException(status_code=404, detail="Фото еще не обработано")
+
+    result_key = processed_key(photo.url)
+    result_path = storage.local_path(result_key)
+    if result_path is None:
+        return RedirectResponse(await run_in_threadpool(storage.url, result_key), status_code=307)
+
+    media_type = photo.mime_type or mimetypes.guess_type(result_path.name)[0] or 'application/octet-stream'
+    try:
+        return file_response(request, result_path, media_type, filename=result_path.name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Файл не найден на диске")
+
+
+@router.get("/thumbnail/{photo_id}")
+async def get_thumbnail(
+    photo_id: int,
+    request: Request,
+    size: int = Query(256, gt=0),
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Получить обработанное фото по ID фото из БД
+    Миниатюра обработанного фото. Размер округляется вверх до допустимого,
+    первая выдача создает миниатюру, следующие берутся из кэша на диске.
+    X-Thumbnail-Cache и Server-Timing показывают попадание и время
     """
-    photo = database.get_photo(photo_id)
+    photo = database.get_photo_brief(photo_id)
 
     if not photo:
         raise HTTPException(status_code=404, detail="Фото не найдено")
@@ -156,49 +410,77 @@ async def get_processed_photo(
     if not photo.isProcessed:
         raise HTTPException(status_code=404, detail="Фото еще не обработано")
 
-    if not os.path.exists(photo.url):
+    source = processed_key(photo.url)
+    bucket = size_bucket(size)
+    try:
+        key = thumbnail_key(photo_id, bucket, await run_in_threadpool(storage.stat, source))
+        path, outcome, elapsed = await thumbnail_cache.get(source, key, bucket)
+        response = file_response(request, path, 'image/jpeg')
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Файл не найден на диске")
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Не удалось создать миниатюру: {str(e)}")
 
-    return FileResponse(
-        path=photo.url,
-        media_type="image/jpeg",
-        filename=os.path.basename(photo.url)
-    )
+    response.headers['X-Thumbnail-Cache'] = outcome.upper()
+    response.headers['Server-Timing'] = f'thumbnail;desc="{outcome}";dur={elapsed * 1000:.2f}'
+    return response
 
 
 @router.get("/user", response_model=UserPhotosResponse)
 async def get_user_photos(
+    request: Request,
     current_user: dict = Depends(get_current_user),
     limit: int = 50,
     offset: int = 0,
-    processed: Optional[bool] = None
+    processed: Optional[bool] = None,
+    cursor: Optional[str] = None
 ):
     """
-    Получить все фото пользователя с пагинацией
+    Получить все фото пользователя с пагинацией.
+    Для глубокой прокрутки передавайте next_cursor из предыдущего ответа вместо offset.
+    Ответ несет ETag; на If-None-Match с актуальной версией отвечает 304
     """
     user_id = current_user['id']
-    photos = database.get_user_photos(user_id, limit, offset)
-
-    if processed is not None:
-        photos = [p for p in photos if p.isProcessed == processed]
-
-    total = database.get_photos_count(user_id)
-
-    return UserPhotosResponse(
-        user_id=user_id,
-        total=total,
-        limit=limit,
-        offset=offset,
-        photos=[
-            PhotoBase(
-                id=p.id,
-                url=p.url,
-                processed=p.isProcessed,
-                timestamp=p.timestamp if p.timestamp else None
-            )
+    after = None
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        if after is None:
+            raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+    # Версия читается до фото: если фото изменятся между запросами, ETag окажется
+    # старше тела, и следующий запрос получит 200, а не устаревший 304
+    stats = database.get_photo_stats(user_id)
+    headers = listing_headers('photos', user_id, stats['version'], {
+        'processed': processed, 'limit': limit, 'offset': offset, 'cursor': cursor
+    })
+    if (response := not_modified(request, headers)) is not None:
+        return response
+
+    # Берем на одну запись больше, чтобы понять, есть ли следующая страница
+    photos = database.get_user_photos(user_id, limit + 1, offset, processed=processed, after=after)
+    next_cursor = None
+    if len(photos) > limit:
+        photos = photos[:limit]
+        next_cursor = encode_cursor(photos[-1].timestamp, photos[-1].id)
+
+    if processed is None:
+        total = stats['total']
+    else:
+        total = stats['processed'] if processed else stats['pending']
+
+    # Страница собирается из строк БД и кодируется orjson напрямую, без моделей Pydantic
+    # и повторной валидации; схема ответа в OpenAPI по-прежнему задается response_model
+    return ORJSONResponse({
+        'user_id': user_id,
+        'total': total,
+        'limit': limit,
+        'offset': offset,
+        'next_cursor': next_cursor,
+        'photos': [
+            {'id': p.id, 'url': p.url, 'processed': p.isProcessed, 'timestamp': p.timestamp}
             for p in photos
         ]
-    )
+    }, headers=headers)
 
 
 @router.get("/unprocessed", response_model=UnprocessedPhotosResponse)
@@ -211,19 +493,16 @@ async def get_unprocessed_photos(
     """
     photos = database.get_unprocessed_photos(limit)
 
-    return UnprocessedPhotosResponse(
-        count=len(photos),
-        photos=[
-            PhotoInfo(
-                id=p.id,
-                url=p.url,
-                user_id=p.user_id,
-                processed=p.isProcessed,
-                timestamp=p.timestamp if p.timestamp else None
-            )
+    return ORJSONResponse({
+        'count': len(photos),
+        'photos': [
+            {
+                'id': p.id, 'url': p.url, 'processed': p.isProcessed, 'timestamp': p.timestamp,
+                'user_id': p.user_id, 'width': p.width, 'height': p.height
+            }
             for p in photos
         ]
-    )
+    })
 
 
 @router.get("/{photo_id}", response_model=PhotoInfo)
@@ -234,7 +513,7 @@ async def get_photo_info(
     """
     Получить информацию о фото по ID
     """
-    photo = database.get_photo(photo_id)
+    photo = database.get_photo_brief(photo_id)
 
     if not photo:
         raise HTTPException(status_code=404, detail="Фото не найдено")
@@ -247,7 +526,9 @@ async def get_photo_info(
         url=photo.url,
         user_id=photo.user_id,
         processed=photo.isProcessed,
-        timestamp=photo.timestamp if photo.timestamp else None
+        timestamp=photo.timestamp if photo.timestamp else None,
+        width=photo.width,
+        height=photo.height
     )
 
 
@@ -259,24 +540,13 @@ async def delete_photo(
     """
     Удалить фото из БД
     """
-    photo = database.get_photo(photo_id)
+    photo = database.delete_photo(photo_id, current_user['id'])
 
     if not photo:
-        raise HTTPException(status_code=404, detail="Фото не найдено")
-
-    if photo.user_id != current_user['id']:
-        raise HTTPException(status_code=403, detail="Доступ запрещён")
-
-    success = database.delete_photo(photo_id)
-
-    if not success:
+        raise_not_accessible(photo_id, current_user['id'])
         raise HTTPException(status_code=500, detail="Не удалось удалить фото из БД")
 
-    try:
-        if os.path.exists(photo.url):
-            os.remove(photo.url)
-    except Exception as e:
-        print(f"Ошибка при удалении файла {photo.url}: {e}")
+    await remove_photo_files([photo])
 
     return PhotoDeleteResponse(
         message='Фото успешно удалено',
@@ -284,6 +554,29 @@ async def delete_photo(
     )
 
 
+@router.post("/bulk-delete", response_model=PhotoBulkDeleteResponse)
+async def delete_photos(
+    request: PhotoBulkDeleteRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Удалить несколько фото одним запросом. Чужие и несуществующие id попадают в not_found
+    """
+    photo_ids = list(dict.fromkeys(request.photo_ids))
+    if len(photo_ids) > MAX_BULK_DELETE:
+        raise HTTPException(status_code=413, detail=f"Слишком много фото. Максимум {MAX_BULK_DELETE}")
+
+    photos = database.delete_photos(photo_ids, current_user['id'])
+    await remove_photo_files(photos)
+
+    deleted = {photo.id for photo in photos}
+    return PhotoBulkDeleteResponse(
+        message=f'Удалено фото: {len(deleted)}',
+        deleted=[photo_id for photo_id in photo_ids if photo_id in deleted],
+        not_found=[photo_id for photo_id in photo_ids if photo_id not in deleted]
+    )
+
+
 @router.put("/{photo_id}/status", response_model=PhotoStatusUpdateResponse)
 async def update_photo_status(
     photo_id: int,
@@ -293,18 +586,11 @@ async def update_photo_status(
     """
     Обновить статус обработки фото
     """
-    photo = database.get_photo(photo_id)
-
-    if not photo:
-        raise HTTPException(status_code=404, detail="Фото не найдено")
-
-    if photo.user_id != current_user['id']:
-        raise HTTPException(status_code=403, detail="Доступ запрещён")
-
-    success = database.update_photo_status(photo_id, status_update.isProcessed)
+    success = database.update_photo_status(photo_id, status_update.isProcessed, current_user['id'])
 
     if not success:
-        raise HTTPException(status_code=404, detail="Фото не найдено или не удалось обновить")
+        raise_not_accessible(photo_id, current_user['id'])
+        raise HTTPException(status_code=500, detail="Не удалось обновить статус фото")
 
     return PhotoStatusUpdateResponse(
         message='Статус фото обновлен',
@@ -315,21 +601,24 @@ async def update_photo_status(
 
 @router.get("/stats/count", response_model=PhotoStatsResponse)
 async def get_photos_stats(
+    request: Request,
+    response: Response,
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Получить статистику по фото
+    Получить статистику по фото; на If-None-Match с актуальной версией - 304
     """
     user_id = current_user['id']
-    total = database.get_photos_count(user_id)
-
-    photos = database.get_user_photos(user_id, limit=1000)
-    processed = sum(1 for p in photos if p.isProcessed)
-    unprocessed = total - processed
+    stats = database.get_photo_stats(user_id)
+    headers = listing_headers('stats', user_id, stats['version'])
+    if (not_modified_response := not_modified(request, headers)) is not None:
+        return not_modified_response
+    response.headers.update(headers)
 
     return PhotoStatsResponse(
         user_id=user_id,
-        total=total,
-        processed=processed,
-        unprocessed=unprocessed
+        total=stats['total'],
+        processed=stats['processed'],
+        unprocessed=stats['pending'],
+        bytes=stats['bytes']
     )
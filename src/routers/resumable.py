@@ -0,0 +1,238 @@
+from datetime import timedelta
+import os
+import uuid
+from pathlib import Path
+from typing import Optional
+
+import aiofiles
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+
+from src.database.database import database
+from src.routers.auth import get_current_user
+from src.ml.client import enqueue_processing
+from src.utils.storage import storage, original_key
+from src.schemas import ResumableUploadCreate, ResumableUploadResponse, PhotoUploadResponse
+from src.utils.ingest import normalize_image, ImageTooLarge
+from src.utils.uploads import inspect_file, partial_path, UnsupportedImage, EXTENSIONS, MAX_UPLOAD_SIZE
+
+# Протокол в духе tus: POST создает загрузку, PATCH дописывает байты с Upload-Offset,
+# HEAD возвращает текущий offset, POST .../finalize создает фото и ставит обработку
+router = APIRouter(prefix="/photo/uploads", tags=["photo"])
+
+# Незавершенная загрузка удаляется, если в нее столько времени ничего не дописывали
+UPLOAD_TTL = timedelta(hours=int(os.getenv('RESUMABLE_UPLOAD_TTL_HOURS', 24)))
+# Сколько PATCH может держать запись; захват упавшего процесса перехватывается по истечении
+WRITE_LEASE = timedelta(minutes=int(os.getenv('RESUMABLE_WRITE_LEASE_MINUTES', 30)))
+
+
+def _upload_response(upload) -> ResumableUploadResponse:
+    return ResumableUploadResponse(
+        upload_id=upload.id,
+        filename=upload.filename,
+        offset=upload.offset,
+        length=upload.length,
+        status=upload.status,
+        expires_at=upload.expires_at,
+        photo_id=upload.photo_id,
+        task_id=upload.task_id
+    )
+
+
+def _get_upload_or_404(upload_id: str, user_id: int):
+    upload = database.get_upload(upload_id, user_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Загрузка не найдена")
+    return upload
+
+
+@router.post("", response_model=ResumableUploadResponse, status_code=201)
+async def create_upload(
+    request: ResumableUploadCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Создать возобновляемую загрузку. Повтор с тем же Idempotency-Key вернет ту же загрузку
+    """
+    if request.length <= 0 or request.length > MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Недопустимый размер. Максимум {MAX_UPLOAD_SIZE // (1024 * 1024)} МБ"
+        )
+
+    upload_id = uuid.uuid4().hex
+    upload, created = database.create_upload(
+        upload_id, current_user['id'], request.filename, request.length, idempotency_key, UPLOAD_TTL
+    )
+    if not upload:
+        raise HTTPException(status_code=500, detail="Не удалось создать загрузку")
+    if created:
+        partial_path(upload.id).touch()
+    else:
+        response.status_code = 200
+
+    response.headers['Location'] = f"{router.prefix}/{upload.id}"
+    return _upload_response(upload)
+
+
+@router.head("/{upload_id}")
+async def get_upload_offset(
+    upload_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Текущий offset загрузки: с него клиент продолжает после обрыва
+    """
+    upload = _get_upload_or_404(upload_id, current_user['id'])
+    return Response(headers={
+        'Upload-Offset': str(upload.offset),
+        'Upload-Length': str(upload.length),
+        'Cache-Control': 'no-store'
+    })
+
+
+@router.get("/{upload_id}", response_model=ResumableUploadResponse)
+async def get_upload(
+    upload_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Состояние загрузки
+    """
+    return _upload_response(_get_upload_or_404(upload_id, current_user['id']))
+
+
+@router.patch("/{upload_id}")
+async def append_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Дописать байты начиная с Upload-Offset. При обрыве соединения сохраняется все, что успело прийти
+    """
+    upload = _get_upload_or_404(upload_id, current_user['id'])
+    if upload.status != 'uploading':
+        raise HTTPException(status_code=409, detail="Загрузка уже завершена")
+    if upload_offset != upload.offset:
+        raise HTTPException(status_code=409, detail=f"Ожидался Upload-Offset {upload.offset}")
+
+    # Запись захватывается до первого байта: второй PATCH с тем же offset получит 409, а не перезапишет файл
+    token = uuid.uuid4().hex
+    if not database.claim_upload_write(upload_id, current_user['id'], upload_offset, token, WRITE_LEASE):
+        raise HTTPException(status_code=409, detail="Загрузка изменяется параллельным запросом")
+
+    written = 0
+    too_large = False
+    try:
+        async with aiofiles.open(partial_path(upload_id), 'r+b') as out_file:
+            await out_file.seek(upload_offset)
+            try:
+                async for chunk in request.stream():
+                    if upload_offset + written + len(chunk) > upload.length:
+                        too_large = True
+                        break
+                    await out_file.write(chunk)
+                    written += len(chunk)
+            except ClientDisconnect:
+                pass
+    finally:
+        advanced = database.advance_upload(upload_id, token, upload_offset + written, UPLOAD_TTL)
+
+    if not advanced:
+        raise HTTPException(status_code=409, detail="Загрузка изменена параллельным запросом")
+    if too_large:
+        raise HTTPException(status_code=413, detail="Данные выходят за объявленный размер загрузки")
+
+    return Response(status_code=204, headers={'Upload-Offset': str(upload_offset + written)})
+
+
+@router.post("/{upload_id}/finalize", response_model=PhotoUploadResponse)
+async def finalize_upload(
+    upload_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Завершить загрузку: создать фото и поставить обработку. Повторный вызов
+    возвращает тот же результат, задача обработки ставится ровно один раз
+    """
+    user_id = current_user['id']
+    upload = _get_upload_or_404(upload_id, user_id)
+
+    if upload.status == 'uploading':
+        if upload.offset != upload.length:
+            raise HTTPException(status_code=409, detail=f"Загружено {upload.offset} из {upload.length} байт")
+        if database.claim_upload_finalize(upload_id, user_id):
+            await _complete(upload, user_id)
+        upload = _get_upload_or_404(upload_id, user_id)
+
+    if upload.status != 'finalized':
+        raise HTTPException(status_code=409, detail="Загрузка уже завершается, повторите запрос")
+
+    if upload.task_id is None:
+        task_id = str(uuid.uuid4())
+        if database.claim_upload_dispatch(upload_id, task_id):
+            photo = database.get_photo_brief(upload.photo_id)
+            try:
+                enqueue_processing(photo.url, photo.id, task_id=task_id)
+            except Exception as e:
+                database.release_upload_dispatch(upload_id)
+                raise HTTPException(status_code=503, detail=f"Не удалось поставить обработку: {str(e)}")
+        upload = _get_upload_or_404(upload_id, user_id)
+
+    return PhotoUploadResponse(
+        photo_id=upload.photo_id,
+        task_id=upload.task_id or '',
+        status='processing',
+        message='Фото отправлено на обработку',
+        original_filename=upload.filename,
+        saved_as=Path(database.get_photo_brief(upload.photo_id).url).name
+    )
+
+
+async def _complete(upload, user_id: int):
+    """Переносит собранный файл в хранилище и создает фото; вызывается только владельцем финализации"""
+    source = partial_path(upload.id)
+    try:
+        saved = await run_in_threadpool(inspect_file, source)
+        saved = await run_in_threadpool(normalize_image, saved)
+    except UnsupportedImage:
+        database.release_upload_finalize(upload.id, user_id)
+        raise HTTPException(status_code=400, detail="Файл должен быть изображением")
+    except ImageTooLarge:
+        database.release_upload_finalize(upload.id, user_id)
+        raise HTTPException(status_code=413, detail="Слишком большое разрешение изображения")
+    except FileNotFoundError:
+        # Файл загрузки пропал (например, удален по сроку): данные нужно загрузить заново
+        database.release_upload_finalize(upload.id, user_id)
+        raise HTTPException(status_code=410, detail="Данные загрузки не найдены, начните загрузку заново")
+    except Exception as e:
+        database.release_upload_finalize(upload.id, user_id)
+        raise HTTPException(status_code=500, detail=f"Не удалось прочитать загруженный файл: {str(e)}")
+
+    key = original_key(f"{uuid.uuid4()}{EXTENSIONS[saved.mime_type]}")
+    try:
+        await run_in_threadpool(storage.put_file, key, source)
+    except Exception as e:
+        # Собранный файл остался на месте: возвращаем загрузку в uploading, чтобы финализацию можно было повторить
+        database.release_upload_finalize(upload.id, user_id)
+        try:
+            await run_in_threadpool(storage.delete, key)
+        except Exception as delete_error:
+            print(f"Не удалось удалить недописанный объект {key}: {delete_error}")
+        raise HTTPException(status_code=503, detail=f"Не удалось сохранить файл: {str(e)}")
+    photo = database.complete_upload(
+        upload.id, user_id, url=key, size=saved.size,
+        content_hash=saved.sha256, mime_type=saved.mime_type,
+        width=saved.width, height=saved.height
+    )
+    if not photo:
+        # Возвращаем файл на место, чтобы финализацию можно было повторить
+        await run_in_threadpool(storage.get_file, key, source)
+        await run_in_threadpool(storage.delete, key)
+        database.release_upload_finalize(upload.id, user_id)
+        raise HTTPException(status_code=500, detail="Не удалось создать запись о фото")
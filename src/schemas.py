@@ -66,6 +66,8 @@ class PhotoBase(BaseModel):
 
 class PhotoInfo(PhotoBase):
     user_id: int
+    width: Optional[int] = None
+    height: Optional[int] = None
 
 
 class PhotoUploadResponse(BaseModel):
@@ -118,6 +120,7 @@ class UserPhotosResponse(BaseModel):
     total: int
     limit: int
     offset: int
+    next_cursor: Optional[str] = None
     photos: List[PhotoBase]
 
 
@@ -131,6 +134,16 @@ class PhotoDeleteResponse(BaseModel):
     photo_id: int
 
 
+class PhotoBulkDeleteRequest(BaseModel):
+    photo_ids: List[int]
+
+
+class PhotoBulkDeleteResponse(BaseModel):
+    message: str
+    deleted: List[int]
+    not_found: List[int]
+
+
 class PhotoStatusUpdateRequest(BaseModel):
     isProcessed: bool = True
 
@@ -146,6 +159,46 @@ class PhotoStatsResponse(BaseModel):
     total: int
     processed: int
     unprocessed: int
+    bytes: int = 0
 
 
+class ResumableUploadCreate(BaseModel):
+    filename: str
+    length: int
+
+
+class ResumableUploadResponse(BaseModel):
+    upload_id: str
+    filename: str
+    offset: int
+    length: int
+    status: str
+    expires_at: datetime
+    photo_id: Optional[int] = None
+    task_id: Optional[str] = None
 
+
+class BatchUploadItem(BaseModel):
+    original_filename: str
+    photo_id: Optional[int] = None
+    task_id: Optional[str] = None
+    saved_as: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchUploadResponse(BaseModel):
+    batch_id: str
+    group_id: Optional[str] = None
+    accepted: int
+    rejected: int
+    photos: List[BatchUploadItem]
+
+
+class BatchProgressResponse(BaseModel):
+    batch_id: str
+    group_id: Optional[str] = None
+    total: int
+    processed: int
+    pending: int
+    progress: float
+    created_at: datetime
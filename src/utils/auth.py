@@ -1,17 +1,61 @@
 from datetime import timedelta, datetime
+import hashlib
+import os
+import time
 
 import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
+from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
 
 from fastapi import Cookie
 
-private_key = 'certs/private_key.pem'
-with open(private_key) as f:
-    key = f.read()
-    private_key = key
-public_key = 'certs/public_key.pem'
-with open(public_key) as f:
-    key = f.read()
-    public_key = key
+from src.utils.cache import TTLCache
+
+# Текущий ключ подписи. Алгоритм определяется типом ключа:
+# RSA -> RS256, EC P-256 -> ES256, Ed25519 -> EdDSA
+private_key_path = os.getenv('JWT_PRIVATE_KEY', 'certs/private_key.pem')
+public_key_path = os.getenv('JWT_PUBLIC_KEY', 'certs/public_key.pem')
+# id ключа, попадает в заголовок kid выпускаемых токенов
+current_kid = os.getenv('JWT_KID', 'default')
+# Ключи, которыми токены больше не подписываются, но еще принимаются: "kid1:path1,kid2:path2"
+previous_keys = os.getenv('JWT_PREVIOUS_KEYS', '')
+# Токены, выпущенные до появления kid, проверяются ключом с этим id
+legacy_kid = os.getenv('JWT_LEGACY_KID', 'default')
+
+# Кэш уже проверенных токенов: sha256(токен) -> claims
+_verified = TTLCache(
+    maxsize=int(os.getenv('JWT_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('JWT_CACHE_TTL', 60))
+)
+
+
+def _algorithm_for(key) -> str:
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return 'RS256'
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)):
+        if key.curve.name != 'secp256r1':
+            raise ValueError(f"Неподдерживаемая кривая для JWT: {key.curve.name}")
+        return 'ES256'
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return 'EdDSA'
+    raise ValueError(f"Неподдерживаемый тип ключа для JWT: {type(key).__name__}")
+
+
+def _load_public_key(path: str):
+    with open(path, 'rb') as f:
+        key = load_pem_public_key(f.read())
+    return key, _algorithm_for(key)
+
+
+with open(private_key_path, 'rb') as f:
+    private_key = load_pem_private_key(f.read(), password=None)
+algorithm = _algorithm_for(private_key)
+
+# kid -> (публичный ключ, алгоритм). Ключи разобраны один раз при старте
+public_keys = {current_kid: _load_public_key(public_key_path)}
+for item in filter(None, previous_keys.split(',')):
+    kid, path = item.split(':', 1)
+    public_keys[kid.strip()] = _load_public_key(path.strip())
 
 
 def create_jwt(user_id: int, login: str, ttl: int = 15):
@@ -24,29 +68,44 @@ def create_jwt(user_id: int, login: str, ttl: int = 15):
         'exp': exp,
 
     }
-    token = jwt.encode(payload=payload, algorithm="RS256", key=private_key)
+    token = jwt.encode(payload=payload, algorithm=algorithm, key=private_key, headers={'kid': current_kid})
     return token
 
 
-def check_access_jwt(access_token: str = Cookie(None)):
+def verify_jwt(token: str):
+    """
+    Проверяет подпись и срок действия токена, возвращает claims или None.
+    Повторная проверка того же токена обслуживается из кэша без криптографии
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    claims = _verified.get(digest)
+    if claims is not None:
+        if claims['exp'] > time.time():
+            return claims
+        _verified.pop(digest)
+        return None
+
     try:
-        if type(access_token) is str:
-            decoded = jwt.decode(jwt=access_token.encode(), key=public_key, algorithms=['RS256'])
-            if access_token != jwt.encode(payload=decoded, algorithm="RS256", key=private_key):
-                return None
-            else:
-                return decoded
-    except:
+        kid = jwt.get_unverified_header(token).get('kid', legacy_kid)
+        if kid not in public_keys:
+            return None
+        key, key_algorithm = public_keys[kid]
+        # Алгоритм задается ключом, а не заголовком токена
+        claims = jwt.decode(jwt=token, key=key, algorithms=[key_algorithm], options={'require': ['exp']})
+    except jwt.PyJWTError:
         return None
 
+    _verified.set(digest, claims, ttl=min(_verified.ttl, claims['exp'] - time.time()))
+    return claims
+
+
+def check_access_jwt(access_token: str = Cookie(None)):
+    if type(access_token) is str:
+        return verify_jwt(access_token)
+    return None
+
 
 def check_refresh_jwt(refresh_token: str = Cookie(None)):
-    try:
-        if type(refresh_token) is str:
-            decoded = jwt.decode(jwt=refresh_token.encode(), key=public_key, algorithms=['RS256'])
-            if refresh_token != jwt.encode(payload=decoded, algorithm="RS256", key=private_key):
-                return None
-            else:
-                return decoded
-    except:
-        return None
\ No newline at end of file
+    if type(refresh_token) is str:
+        return verify_jwt(refresh_token)
+    return None
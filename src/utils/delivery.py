@@ -0,0 +1,81 @@
+import hashlib
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+from src.utils.storage import STORAGE_ROOT
+
+# python - файл отдает приложение; x-accel - nginx по X-Accel-Redirect; x-sendfile - Apache/lighttpd
+FILE_DELIVERY_MODE = os.getenv('FILE_DELIVERY_MODE', 'python')
+# Внутренний location nginx, смотрящий на X_ACCEL_ROOT
+X_ACCEL_PREFIX = os.getenv('X_ACCEL_PREFIX', '/protected/')
+X_ACCEL_ROOT = Path(os.getenv('X_ACCEL_ROOT', STORAGE_ROOT)).resolve()
+# Результаты приватные: кэшируются браузером, общие кэши без авторизации их не получат
+RESULT_CACHE_CONTROL = os.getenv('RESULT_CACHE_CONTROL', 'private, max-age=86400')
+# Списки и статистика меняются часто: клиент хранит ответ, но каждый раз переспрашивает по ETag
+LISTING_CACHE_CONTROL = os.getenv('LISTING_CACHE_CONTROL', 'private, no-cache')
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    """Сильный ETag: меняется при любой перезаписи файла"""
+    base = f"{stat_result.st_ino}-{stat_result.st_mtime_ns}-{stat_result.st_size}"
+    return f'"{hashlib.sha1(base.encode()).hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Совпадает ли ETag с одним из перечисленных в If-None-Match (слабое сравнение)"""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is None:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in tags or etag.removeprefix('W/') in tags
+
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Проверка If-None-Match, а при его отсутствии - If-Modified-Since"""
+    if request.headers.get('if-none-match') is not None:
+        return etag_matches(request, etag)
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is not None:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def file_response(request: Request, path, media_type: str, filename: str = None,
+                  etag: str = None, cache_control: str = RESULT_CACHE_CONTROL) -> Response:
+    """
+    Отдает файл с ETag/Last-Modified/Cache-Control, отвечает 304 на условный запрос.
+    Range обрабатывает FileResponse, а в режимах x-accel/x-sendfile байты отдает прокси.
+    Если файла нет, бросает FileNotFoundError
+    """
+    stat_result = os.stat(path)
+    etag = etag or file_etag(stat_result)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': formatdate(stat_result.st_mtime, usegmt=True),
+        'Cache-Control': cache_control,
+    }
+    if is_not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    if FILE_DELIVERY_MODE == 'x-accel':
+        relative = Path(path).resolve().relative_to(X_ACCEL_ROOT)
+        headers['X-Accel-Redirect'] = X_ACCEL_PREFIX.rstrip('/') + '/' + relative.as_posix()
+        return Response(headers=headers, media_type=media_type)
+    if FILE_DELIVERY_MODE == 'x-sendfile':
+        headers['X-Sendfile'] = str(Path(path).resolve())
+        return Response(headers=headers, media_type=media_type)
+
+    return FileResponse(
+        path=path,
+        media_type=media_type,
+        filename=filename,
+        headers=headers,
+        stat_result=stat_result
+    )
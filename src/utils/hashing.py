@@ -0,0 +1,100 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.metrics import (
+    PASSWORD_HASH_QUEUED, PASSWORD_HASH_ACTIVE, PASSWORD_HASH_REJECTED, PASSWORD_HASH_QUEUE_WAIT_SECONDS,
+)
+from src.utils.utils import hash_password, validate_password
+
+
+class PasswordPoolOverloaded(Exception):
+    """Очередь на хеширование паролей переполнена"""
+
+
+class PasswordHasher:
+    """
+    Bcrypt в отдельном ограниченном пуле потоков, чтобы всплеск логинов
+    не занимал общий threadpool сервера и не блокировал остальные эндпоинты
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 64):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        # Слоты на выполняющиеся и ожидающие задачи; сверх лимита запрос отклоняется сразу
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _run(self, submitted_at: float, fn, *args):
+        wait = time.perf_counter() - submitted_at
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        PASSWORD_HASH_QUEUED.dec()
+        PASSWORD_HASH_ACTIVE.inc()
+        PASSWORD_HASH_QUEUE_WAIT_SECONDS.observe(wait)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+            PASSWORD_HASH_ACTIVE.dec()
+            self._slots.release()
+
+    def _release_cancelled(self, future):
+        """Задачу отменили, пока она ждала в очереди: _run не выполнится, слот освобождается здесь"""
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+            PASSWORD_HASH_QUEUED.dec()
+            self._slots.release()
+
+    async def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            PASSWORD_HASH_REJECTED.inc()
+            raise PasswordPoolOverloaded()
+        with self._lock:
+            self.queued += 1
+        PASSWORD_HASH_QUEUED.inc()
+        future = self._executor.submit(self._run, time.perf_counter(), fn, *args)
+        future.add_done_callback(self._release_cancelled)
+        return await asyncio.wrap_future(future)
+
+    async def hash(self, password: str) -> str:
+        return (await self.run(hash_password, password)).hex()
+
+    async def verify(self, password: str, hash: str) -> bool:
+        return await self.run(validate_password, password, hash)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'queued': self.queued,
+                'active': self.active,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'wait_seconds_total': self.wait_seconds_total,
+                'wait_seconds_max': self.wait_seconds_max,
+            }
+
+
+password_hasher = PasswordHasher(
+    workers=int(os.getenv('BCRYPT_WORKERS', 2)),
+    max_queue=int(os.getenv('BCRYPT_MAX_QUEUE', 64))
+)
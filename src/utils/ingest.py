@@ -0,0 +1,79 @@
+import os
+import uuid
+from dataclasses import replace
+
+from PIL import Image, ImageOps, ExifTags, UnidentifiedImageError
+
+from src.utils.uploads import SavedUpload, UnsupportedImage, inspect_file
+
+# Больше стольких пикселей не принимаем: защита от decompression bomb (маленький файл, огромная картинка)
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', 60_000_000))
+# Длинная сторона, до которой уменьшается фото перед обработкой; 0 - не уменьшать
+MAX_IMAGE_SIDE = int(os.getenv('MAX_IMAGE_SIDE', 0))
+INGEST_JPEG_QUALITY = int(os.getenv('INGEST_JPEG_QUALITY', 92))
+
+# Pillow сам откажется декодировать картинку больше лимита, даже если проверку обойдут
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+_FORMATS = {
+    'image/jpeg': 'JPEG',
+    'image/png': 'PNG',
+    'image/bmp': 'BMP',
+    'image/webp': 'WEBP',
+}
+# Форматы, у которых EXIF лежит в заголовке и читается без декодирования
+_EXIF_IN_HEADER = ('JPEG', 'WEBP')
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def normalize_image(saved: SavedUpload) -> SavedUpload:
+    """
+    Приводит загруженное изображение к виду, удобному для обработки.
+    Размеры и ориентация читаются из заголовка без декодирования; файл
+    перекодируется, только если нужно повернуть его по EXIF или уменьшить
+    до MAX_IMAGE_SIDE. Возвращает описание файла с размерами, при перекодировании
+    с новыми размером и sha256. ImageTooLarge - слишком большое разрешение
+    """
+    try:
+        with Image.open(saved.path) as image:
+            if image.format != _FORMATS.get(saved.mime_type):
+                raise UnsupportedImage()
+            width, height = image.size
+            if width * height > MAX_IMAGE_PIXELS:
+                raise ImageTooLarge()
+
+            orientation = 1
+            if image.format in _EXIF_IN_HEADER:
+                orientation = image.getexif().get(ExifTags.Base.Orientation, 1)
+            downscale = MAX_IMAGE_SIDE and max(width, height) > MAX_IMAGE_SIDE
+            if orientation == 1 and not downscale:
+                return replace(saved, width=width, height=height)
+
+            if downscale and image.format == 'JPEG':
+                # Декодер JPEG сразу уменьшает в 2/4/8 раз, не поднимая полное разрешение в память
+                image.draft(image.mode, (MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+            normalized = ImageOps.exif_transpose(image)
+            if downscale:
+                normalized.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.Resampling.LANCZOS)
+
+            options = {}
+            if image.format == 'JPEG':
+                options = {'quality': INGEST_JPEG_QUALITY, 'exif': normalized.getexif()}
+            elif image.format == 'WEBP':
+                options = {'exif': normalized.getexif()}
+            tmp_path = saved.path.with_name(f".{saved.path.name}.{uuid.uuid4().hex}.tmp")
+            try:
+                normalized.save(tmp_path, image.format, **options)
+                os.replace(tmp_path, saved.path)
+            finally:
+                tmp_path.unlink(missing_ok=True)
+            width, height = normalized.size
+    except Image.DecompressionBombError:
+        raise ImageTooLarge()
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise UnsupportedImage()
+
+    return replace(inspect_file(saved.path), width=width, height=height)
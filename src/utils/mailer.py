@@ -0,0 +1,71 @@
+import os
+import smtplib
+from email.header import Header
+from email.mime.text import MIMEText
+
+
+class SMTPMailer:
+    """
+    Отправка писем через одно переиспользуемое SMTP-соединение:
+    STARTTLS и авторизация выполняются один раз, а не на каждое письмо
+    """
+
+    def __init__(self, host: str, port: int, sender: str, password: str = None,
+                 starttls: bool = True, timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._server = None
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+        if self.password:
+            server.login(self.sender, self.password)
+        self._server = server
+
+    def _connection(self):
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except smtplib.SMTPException:
+                pass
+            self.close()
+        self._connect()
+        return self._server
+
+    def send(self, receiver: str, subject: str, body: str):
+        msg = MIMEText(body, 'plain', 'utf-8')
+        msg['Subject'] = Header(subject, 'utf-8')
+        msg['From'] = self.sender
+        msg['To'] = receiver
+        try:
+            self._connection().sendmail(self.sender, receiver, msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            # Сервер закрыл простаивавшее соединение - одна попытка с новым
+            self.close()
+            self._connection().sendmail(self.sender, receiver, msg.as_string())
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+
+def create_mailer():
+    return SMTPMailer(
+        host=os.getenv('SMTP_HOST', 'smtp.yandex.ru'),
+        port=int(os.getenv('SMTP_PORT', 587)),
+        sender=os.getenv('SMTP_SENDER', 'prohanter34@yandex.ru'),
+        password=os.getenv('EMAIL_PASSWORD'),
+        starttls=os.getenv('SMTP_STARTTLS', '1') == '1',
+        timeout=float(os.getenv('SMTP_TIMEOUT', 30)),
+    )
@@ -0,0 +1,118 @@
+import os
+import time
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess,
+)
+from sqlalchemy import event
+
+# При нескольких процессах (uvicorn --workers, prefork Celery) метрики собираются через
+# файлы в PROMETHEUS_MULTIPROC_DIR; переменная должна быть задана до старта процессов
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+# Бакеты от миллисекунд до минуты: инференс на CPU бывает долгим
+_SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Время обработки HTTP-запроса',
+    ['method', 'route', 'status'], buckets=_SECONDS_BUCKETS
+)
+DB_QUERY_SECONDS = Histogram(
+    'db_query_duration_seconds', 'Время выполнения SQL-запроса',
+    ['operation'], buckets=_SECONDS_BUCKETS
+)
+TASK_QUEUE_WAIT_SECONDS = Histogram(
+    'celery_task_queue_wait_seconds', 'Время от постановки задачи до начала выполнения',
+    ['task'], buckets=_SECONDS_BUCKETS + (120, 300, 600)
+)
+TASK_SECONDS = Histogram(
+    'celery_task_duration_seconds', 'Время выполнения задачи',
+    ['task', 'state'], buckets=_SECONDS_BUCKETS + (120, 300, 600)
+)
+PROCESSING_STAGE_SECONDS = Histogram(
+    'photo_processing_stage_seconds', 'Время этапа обработки фото',
+    ['stage'], buckets=_SECONDS_BUCKETS
+)
+BLUR_BOX_SECONDS = Histogram(
+    'photo_blur_box_seconds', 'Время размытия одной найденной области',
+    ['kind'], buckets=_SECONDS_BUCKETS
+)
+DETECTIONS_PER_IMAGE = Histogram(
+    'photo_detections_per_image', 'Число найденных объектов на изображении',
+    ['kind'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+# Пул bcrypt (src/utils/hashing.py): глубина очереди, отказы при переполнении и ожидание в очереди
+PASSWORD_HASH_QUEUED = Gauge(
+    'password_hash_queued', 'Операций с паролем в очереди пула bcrypt', multiprocess_mode='livesum'
+)
+PASSWORD_HASH_ACTIVE = Gauge(
+    'password_hash_active', 'Выполняющихся операций с паролем', multiprocess_mode='livesum'
+)
+PASSWORD_HASH_REJECTED = Counter(
+    'password_hash_rejected', 'Операций с паролем, отклоненных из-за переполнения очереди'
+)
+PASSWORD_HASH_QUEUE_WAIT_SECONDS = Histogram(
+    'password_hash_queue_wait_seconds', 'Ожидание операции с паролем в очереди пула bcrypt',
+    buckets=_SECONDS_BUCKETS
+)
+
+_SQL_OPERATIONS = {'select', 'insert', 'update', 'delete', 'with'}
+
+
+def metrics_registry():
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics():
+    """Тело и Content-Type ответа /metrics"""
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
+
+
+def instrument_engine(engine):
+    """Время каждого SQL-запроса движка, по типу операции"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started_at = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ''
+        DB_QUERY_SECONDS.labels(operation if operation in _SQL_OPERATIONS else 'other').observe(
+            time.perf_counter() - context._metrics_started_at
+        )
+
+
+class HTTPMetricsMiddleware:
+    """
+    Время HTTP-запросов по шаблону маршрута (/photo/{photo_id}), а не по фактическому пути,
+    чтобы число рядов метрики не росло с числом фото
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        started_at = time.perf_counter()
+        status = 500
+
+        async def tracked_send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, tracked_send)
+        finally:
+            route = scope.get('route')
+            HTTP_REQUEST_SECONDS.labels(
+                scope['method'], getattr(route, 'path', '<unmatched>'), str(status)
+            ).observe(time.perf_counter() - started_at)
@@ -0,0 +1,112 @@
+import contextvars
+import hmac
+import logging
+import os
+import random
+import time
+import uuid
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+# Запрос профилируется, если в заголовке X-Profile пришел этот токен; пусто - по заголовку нельзя
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+# Доля случайно профилируемых запросов и задач Celery; 0 - только по заголовку
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_TASK_SAMPLE_RATE = float(os.getenv('PROFILE_TASK_SAMPLE_RATE', 0))
+# Интервал сэмплирования pyinstrument, секунды
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.001))
+PROFILE_DIR = Path(os.getenv('PROFILE_DIR', Path(__file__).parent.parent / 'uploads' / 'profiles'))
+# Хранятся только последние профили
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 200))
+
+logger = logging.getLogger(__name__)
+
+# Профилируется ли текущий запрос: тогда и поставленные из него задачи профилируются
+profiling_active = contextvars.ContextVar('profiling_active', default=False)
+
+
+def requests_enabled() -> bool:
+    return bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+
+def start_profiler(async_mode: str = 'disabled'):
+    from pyinstrument import Profiler
+
+    profiler = Profiler(interval=PROFILE_INTERVAL, async_mode=async_mode)
+    profiler.start()
+    return profiler
+
+
+def new_profile_id() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def save_profile(profiler, profile_id: str, kind: str, name: str) -> Path:
+    """
+    Останавливает профайлер (если он еще идет) и пишет профиль в формате speedscope
+    (открывается на speedscope.app как flamegraph). Старые профили сверх
+    PROFILE_MAX_FILES удаляются. Файловый ввод-вывод: из асинхронного кода звать
+    через пул потоков, остановив профайлер в его собственном потоке
+    """
+    from pyinstrument.renderers import SpeedscopeRenderer
+
+    if profiler.is_running:
+        profiler.stop()
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    safe_name = ''.join(ch if ch.isalnum() or ch in '-_.' else '_' for ch in name).strip('_')[:80]
+    filename = f"{profile_id}-{kind}-{safe_name}.speedscope.json"
+    (PROFILE_DIR / filename).write_text(profiler.output(renderer=SpeedscopeRenderer()))
+
+    profiles = sorted(PROFILE_DIR.glob('*.speedscope.json'), key=lambda path: path.stat().st_mtime)
+    for path in profiles[:-PROFILE_MAX_FILES]:
+        path.unlink(missing_ok=True)
+    return PROFILE_DIR / filename
+
+
+def should_profile_task(headers_value) -> bool:
+    """Задача профилируется, если ее поставил профилируемый запрос или она попала в выборку"""
+    return bool(headers_value) or (PROFILE_TASK_SAMPLE_RATE > 0 and random.random() < PROFILE_TASK_SAMPLE_RATE)
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует запрос сэмплирующим профайлером, если пришел заголовок X-Profile
+    с PROFILE_TOKEN или запрос попал в выборку PROFILE_SAMPLE_RATE. Имя файла
+    профиля возвращается в заголовке X-Profile-Id
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _should_profile(self, scope) -> bool:
+        if PROFILE_TOKEN:
+            for key, value in scope['headers']:
+                if key == b'x-profile':
+                    return hmac.compare_digest(value, PROFILE_TOKEN.encode())
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self._should_profile(scope):
+            return await self.app(scope, receive, send)
+
+        profile_id = new_profile_id()
+        token = profiling_active.set(True)
+        profiler = start_profiler(async_mode='enabled')
+
+        async def tagged_send(message):
+            if message['type'] == 'http.response.start':
+                message.setdefault('headers', [])
+                message['headers'] = list(message['headers']) + [(b'x-profile-id', profile_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, tagged_send)
+        finally:
+            profiling_active.reset(token)
+            profiler.stop()
+            route = scope.get('route')
+            path = await run_in_threadpool(
+                save_profile, profiler, profile_id, 'http', f"{scope['method']}-{getattr(route, 'path', scope['path'])}"
+            )
+            logger.info(f"Профиль запроса: {path}")
@@ -0,0 +1,260 @@
+import hashlib
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple, Optional
+
+# local - файлы на диске с шардированием по хэшу имени; s3 - любое S3-совместимое хранилище
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+# Корень локального хранилища; в нем же каталоги приема загрузок и кэша миниатюр при любом STORAGE_BACKEND
+STORAGE_ROOT = Path(os.getenv('STORAGE_ROOT', Path(__file__).parent.parent / 'uploads')).resolve()
+# Уровни вложенности шардов, по 2 hex-символа на уровень: 2 уровня = 65536 каталогов
+STORAGE_SHARD_DEPTH = int(os.getenv('STORAGE_SHARD_DEPTH', 2))
+
+S3_BUCKET = os.getenv('S3_BUCKET', '')
+# Для MinIO и других S3-совместимых хранилищ
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL') or None
+S3_REGION = os.getenv('S3_REGION') or None
+S3_PREFIX = os.getenv('S3_PREFIX', '')
+S3_PRESIGN_TTL = int(os.getenv('S3_PRESIGN_TTL', 3600))
+
+# Ключи объектов: originals/<uuid>.<ext> и processed/blurred_<uuid>.<ext>
+ORIGINALS_PREFIX = 'originals'
+PROCESSED_PREFIX = 'processed'
+# Каталог, абсолютные пути в котором хранились в photos.url до появления хранилища
+LEGACY_UPLOAD_DIR = Path(__file__).parent.parent / 'uploads'
+
+
+class ObjectInfo(NamedTuple):
+    size: int
+    mtime: float
+    etag: str
+
+
+def original_key(filename: str) -> str:
+    return f"{ORIGINALS_PREFIX}/{filename}"
+
+
+def processed_key(key: str) -> str:
+    """Ключ результата обработки для ключа исходника (или старого абсолютного пути)"""
+    return f"{PROCESSED_PREFIX}/blurred_{Path(key).name}"
+
+
+def source_urls(key: str) -> list:
+    """Значения photos.url, которым может принадлежать объект хранилища"""
+    prefix, _, name = key.rpartition('/')
+    if prefix == PROCESSED_PREFIX:
+        name = name.removeprefix('blurred_')
+    return [original_key(name), str(LEGACY_UPLOAD_DIR / name)]
+
+
+class LocalStorage:
+    """
+    Хранилище на локальном диске. Объект prefix/name лежит в prefix/ab/cd/name,
+    где abcd - начало sha1(name), чтобы в одном каталоге не скапливались миллионы файлов.
+    Абсолютные пути (фото, загруженные до появления хранилища) принимаются как ключи,
+    файлы из старых плоских каталогов находятся при чтении
+    """
+
+    def __init__(self, root: Path, shard_depth: int = 2):
+        self.root = root
+        self.shard_depth = shard_depth
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: str) -> Path:
+        """Путь, по которому объект хранится (или будет храниться)"""
+        if os.path.isabs(key):
+            return Path(key)
+        prefix, _, name = key.rpartition('/')
+        digest = hashlib.sha1(name.encode()).hexdigest()
+        shards = [digest[i * 2:i * 2 + 2] for i in range(self.shard_depth)]
+        return self.root.joinpath(prefix, *shards, name)
+
+    def _existing_path(self, key: str) -> Path:
+        path = self.path(key)
+        if not path.exists() and not os.path.isabs(key):
+            flat = self.root / key
+            if flat.exists():
+                return flat
+        return path
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self._existing_path(key)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._existing_path(key), 'rb')
+
+    def stat(self, key: str) -> ObjectInfo:
+        stat_result = os.stat(self._existing_path(key))
+        return ObjectInfo(
+            size=stat_result.st_size,
+            mtime=stat_result.st_mtime,
+            etag=f"{stat_result.st_ino}-{stat_result.st_mtime_ns}-{stat_result.st_size}"
+        )
+
+    def exists(self, key: str) -> bool:
+        return self._existing_path(key).exists()
+
+    def put_file(self, key: str, source: Path):
+        """Переносит локальный файл в хранилище (на одном разделе - переименованием)"""
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(source, path)
+
+    def put_stream(self, key: str, fileobj: BinaryIO):
+        """Записывает объект из потока; читатели не увидят недописанный файл"""
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, 'wb') as out_file:
+                shutil.copyfileobj(fileobj, out_file, 1024 * 1024)
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def get_file(self, key: str, dest: Path):
+        shutil.copyfile(self._existing_path(key), dest)
+
+    def delete(self, key: str):
+        self._existing_path(key).unlink(missing_ok=True)
+
+    def delete_many(self, keys: list):
+        for key in keys:
+            self.delete(key)
+
+    def url(self, key: str) -> Optional[str]:
+        return None
+
+    def iter_keys(self, prefix: str) -> Iterator[tuple]:
+        """Все объекты с ключами prefix/<имя>, включая старый плоский каталог: (ключ, ObjectInfo)"""
+        for dirpath, _, filenames in os.walk(self.root / prefix):
+            for name in filenames:
+                if name.startswith('.'):
+                    continue
+                try:
+                    stat_result = os.stat(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    continue
+                yield f"{prefix}/{name}", ObjectInfo(
+                    size=stat_result.st_size,
+                    mtime=stat_result.st_mtime,
+                    etag=f"{stat_result.st_ino}-{stat_result.st_mtime_ns}-{stat_result.st_size}"
+                )
+
+
+class S3Storage:
+    """
+    S3-совместимое хранилище (AWS, MinIO, Ceph). Объекты читаются и пишутся потоком,
+    общий диск между API и воркерами не нужен. Отдача клиенту - по presigned URL
+    """
+
+    def __init__(self, bucket: str, prefix: str = '', endpoint_url: str = None, region: str = None):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=os.getenv('S3_ACCESS_KEY') or None,
+            aws_secret_access_key=os.getenv('S3_SECRET_KEY') or None
+        )
+        self._client_error = ClientError
+
+    def _key(self, key: str) -> str:
+        # Старые абсолютные пути превращаются в ключи originals/<имя>
+        if os.path.isabs(key):
+            key = original_key(Path(key).name)
+        return self.prefix + key
+
+    def _not_found(self, error) -> bool:
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return None
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+        except self._client_error as e:
+            if self._not_found(e):
+                raise FileNotFoundError(key)
+            raise
+
+    def stat(self, key: str) -> ObjectInfo:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as e:
+            if self._not_found(e):
+                raise FileNotFoundError(key)
+            raise
+        return ObjectInfo(
+            size=head['ContentLength'],
+            mtime=head['LastModified'].timestamp(),
+            etag=head['ETag'].strip('"')
+        )
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.stat(key)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put_file(self, key: str, source: Path):
+        self.client.upload_file(str(source), self.bucket, self._key(key))
+        Path(source).unlink(missing_ok=True)
+
+    def put_stream(self, key: str, fileobj: BinaryIO):
+        self.client.upload_fileobj(fileobj, self.bucket, self._key(key))
+
+    def get_file(self, key: str, dest: Path):
+        try:
+            self.client.download_file(self.bucket, self._key(key), str(dest))
+        except self._client_error as e:
+            if self._not_found(e):
+                raise FileNotFoundError(key)
+            raise
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def delete_many(self, keys: list):
+        """Удаление пачками по 1000 ключей (предел DeleteObjects)"""
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': self._key(key)} for key in keys[i:i + 1000]], 'Quiet': True}
+            )
+
+    def url(self, key: str) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': self._key(key)},
+            ExpiresIn=S3_PRESIGN_TTL
+        )
+
+    def iter_keys(self, prefix: str) -> Iterator[tuple]:
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}{prefix}/"):
+            for item in page.get('Contents', []):
+                yield item['Key'][len(self.prefix):], ObjectInfo(
+                    size=item['Size'],
+                    mtime=item['LastModified'].timestamp(),
+                    etag=item['ETag'].strip('"')
+                )
+
+
+def create_storage():
+    if STORAGE_BACKEND == 's3':
+        return S3Storage(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION)
+    if STORAGE_BACKEND == 'local':
+        return LocalStorage(STORAGE_ROOT, STORAGE_SHARD_DEPTH)
+    raise ValueError(f"Неизвестный STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+
+storage = create_storage()
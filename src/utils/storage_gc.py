@@ -0,0 +1,150 @@
+import os
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+from src.utils.storage import ORIGINALS_PREFIX, PROCESSED_PREFIX, source_urls, processed_key
+from src.utils.uploads import PARTIAL_DIR
+
+# Объекты сверяются с таблицей photos пачками такого размера
+STORAGE_GC_BATCH = int(os.getenv('STORAGE_GC_BATCH', 500))
+# Объекты моложе этого не трогаем: файл уже в хранилище, а запись о фото еще не создана
+STORAGE_GC_GRACE = timedelta(minutes=int(os.getenv('STORAGE_GC_GRACE_MINUTES', 60)))
+# Ограничение нагрузки на диск/S3: удалений в секунду (0 - без ограничения) и всего за запуск
+STORAGE_GC_DELETES_PER_SECOND = float(os.getenv('STORAGE_GC_DELETES_PER_SECOND', 20))
+STORAGE_GC_MAX_DELETES = int(os.getenv('STORAGE_GC_MAX_DELETES', 10000))
+# Только записать в лог, что было бы удалено
+STORAGE_GC_DRY_RUN = os.getenv('STORAGE_GC_DRY_RUN', 'false').lower() in ('1', 'true', 'yes')
+# Через сколько дней после обработки удалять исходник; 0 - хранить всегда
+RETENTION_ORIGINAL_DAYS = int(os.getenv('RETENTION_ORIGINAL_DAYS', 0))
+
+
+class StorageCollector:
+    """
+    Сборщик мусора хранилища: удаляет объекты без записи в photos (исходники
+    несостоявшихся загрузок, результаты обработки удаленных фото), брошенные
+    файлы приема загрузок и, по политике хранения, исходники давно обработанных фото
+    """
+
+    def __init__(self, storage, database, logger, dry_run: bool = STORAGE_GC_DRY_RUN,
+                 deletes_per_second: float = STORAGE_GC_DELETES_PER_SECOND,
+                 max_deletes: int = STORAGE_GC_MAX_DELETES):
+        self.storage = storage
+        self.database = database
+        self.logger = logger
+        self.dry_run = dry_run
+        self.interval = 1 / deletes_per_second if deletes_per_second > 0 else 0
+        self.max_deletes = max_deletes
+        self.deleted = 0
+        self.freed_bytes = 0
+        self._last_delete = 0.0
+
+    @property
+    def exhausted(self) -> bool:
+        return self.deleted >= self.max_deletes
+
+    def _delete(self, key: str, size: int, reason: str) -> bool:
+        if self.exhausted:
+            return False
+        if self.dry_run:
+            self.logger.info(f"[dry-run] удалить {key} ({reason}, {size} байт)")
+        else:
+            wait = self._last_delete + self.interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_delete = time.monotonic()
+            try:
+                self.storage.delete(key)
+            except Exception as e:
+                self.logger.warning(f"Не удалось удалить {key}: {e}")
+                return False
+        self.deleted += 1
+        self.freed_bytes += size
+        return True
+
+    def collect_orphans(self, prefix: str) -> int:
+        """Удаляет объекты prefix/, которым не соответствует ни одно фото"""
+        cutoff = time.time() - STORAGE_GC_GRACE.total_seconds()
+        removed = 0
+        objects = self.storage.iter_keys(prefix)
+        while not self.exhausted and (batch := list(islice(objects, STORAGE_GC_BATCH))):
+            candidates = {key: info for key, info in batch if info.mtime < cutoff}
+            urls = {key: source_urls(key) for key in candidates}
+            existing = self.database.existing_photo_urls([url for items in urls.values() for url in items])
+            for key, info in candidates.items():
+                if not existing.intersection(urls[key]) and self._delete(key, info.size, 'нет фото'):
+                    removed += 1
+        return removed
+
+    def collect_partial(self) -> int:
+        """
+        Удаляет файлы приема обычных загрузок (<uuid>.<ext>), оставшиеся после сбоя.
+        Файлы возобновляемых загрузок (без расширения) удаляет expire_uploads
+        """
+        cutoff = time.time() - STORAGE_GC_GRACE.total_seconds()
+        removed = 0
+        for path in PARTIAL_DIR.glob('*.*'):
+            try:
+                stat_result = path.stat()
+            except FileNotFoundError:
+                continue
+            if stat_result.st_mtime >= cutoff:
+                continue
+            if self.exhausted:
+                break
+            if self.dry_run:
+                self.logger.info(f"[dry-run] удалить {path} (брошенная загрузка, {stat_result.st_size} байт)")
+            else:
+                path.unlink(missing_ok=True)
+            self.deleted += 1
+            self.freed_bytes += stat_result.st_size
+            removed += 1
+        return removed
+
+    def _has_result(self, row) -> bool:
+        """Исходник можно удалять, только если результат обработки действительно лежит в хранилище"""
+        try:
+            if self.storage.exists(processed_key(row.url)):
+                return True
+        except Exception as e:
+            self.logger.warning(f"Не удалось проверить результат фото {row.id}: {e}")
+            return False
+        self.logger.warning(f"Исходник фото {row.id} сохранен: нет результата обработки {processed_key(row.url)}")
+        return False
+
+    def apply_retention(self) -> int:
+        """
+        Удаляет исходники фото, обработанных раньше RETENTION_ORIGINAL_DAYS дней назад.
+        Фото без результата обработки в хранилище пропускаются: исходник - их единственная копия
+        """
+        if RETENTION_ORIGINAL_DAYS <= 0:
+            return 0
+        processed_before = datetime.now() - timedelta(days=RETENTION_ORIGINAL_DAYS)
+        removed = 0
+        after_id = 0
+        while not self.exhausted:
+            rows = self.database.get_expired_originals(processed_before, after_id, STORAGE_GC_BATCH)
+            if not rows:
+                break
+            after_id = rows[-1].id
+            deleted_ids = [
+                row.id for row in rows
+                if self._has_result(row) and self._delete(row.url, 0, 'срок хранения исходника')
+            ]
+            if not self.dry_run:
+                self.database.mark_originals_deleted(deleted_ids)
+            removed += len(deleted_ids)
+        return removed
+
+    def run(self) -> dict:
+        started_at = time.monotonic()
+        result = {
+            'dry_run': self.dry_run,
+            'originals': self.collect_orphans(ORIGINALS_PREFIX),
+            'processed': self.collect_orphans(PROCESSED_PREFIX),
+            'partial': self.collect_partial(),
+            'retention': self.apply_retention(),
+        }
+        result['freed_bytes'] = self.freed_bytes
+        result['seconds'] = round(time.monotonic() - started_at, 2)
+        return result
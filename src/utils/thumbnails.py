@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import io
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO
+
+from PIL import Image
+from starlette.concurrency import run_in_threadpool
+
+from src.utils.storage import storage, ObjectInfo, STORAGE_ROOT
+
+# Локальный кэш миниатюр в каталоге хранилища (при STORAGE_BACKEND=s3 - в STORAGE_ROOT на диске)
+THUMBNAIL_DIR = STORAGE_ROOT / "thumbnails"
+# Допустимые размеры (по длинной стороне); запрошенный размер округляется вверх до ближайшего
+THUMBNAIL_SIZES = sorted(int(size) for size in os.getenv('THUMBNAIL_SIZES', '128,256,512,1024').split(','))
+# Предел места под миниатюры; при превышении удаляются давно не запрашиваемые
+THUMBNAIL_CACHE_BYTES = int(os.getenv('THUMBNAIL_CACHE_BYTES', 512 * 1024 * 1024))
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', 85))
+
+
+def size_bucket(size: int) -> int:
+    """Ближайший допустимый размер не меньше запрошенного"""
+    for bucket in THUMBNAIL_SIZES:
+        if bucket >= size:
+            return bucket
+    return THUMBNAIL_SIZES[-1]
+
+
+def thumbnail_key(photo_id: int, bucket: int, source: ObjectInfo) -> str:
+    """Имя миниатюры; меняется вместе с исходным объектом, поэтому устаревшая копия не отдается"""
+    signature = hashlib.sha1(f"{source.etag}-{source.size}".encode()).hexdigest()[:12]
+    return f"{photo_id}_{bucket}_{signature}.jpg"
+
+
+def render_thumbnail(source: BinaryIO, dest: Path, bucket: int):
+    """Уменьшает изображение до bucket по длинной стороне и атомарно записывает JPEG"""
+    if not source.seekable():
+        source = io.BytesIO(source.read())
+    with Image.open(source) as image:
+        # Для JPEG декодер сразу уменьшает картинку в 2/4/8 раз, что намного быстрее полного декодирования
+        image.draft('RGB', (bucket, bucket))
+        image.thumbnail((bucket, bucket), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        tmp_path = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            image.save(tmp_path, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+            os.replace(tmp_path, dest)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+
+class ThumbnailCache:
+    """
+    LRU-кэш миниатюр на диске с ограничением по суммарному размеру.
+    Одновременные запросы одной миниатюры ждут одно общее уменьшение (single-flight).
+    Индекс у каждого процесса свой и восстанавливается по mtime файлов при старте
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._index = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        # outcome -> [количество, суммарное время, максимальное время]
+        self._latency = {'hit': [0, 0.0, 0.0], 'miss': [0, 0.0, 0.0], 'shared': [0, 0.0, 0.0]}
+        self._load()
+
+    def _load(self):
+        entries = []
+        for path in self.directory.glob('*.jpg'):
+            try:
+                stat_result = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat_result.st_mtime, path.name, stat_result.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._index:
+            name, size = self._index.popitem(last=False)
+            self._bytes -= size
+            (self.directory / name).unlink(missing_ok=True)
+
+    def _lookup(self, key: str):
+        path = self.directory / key
+        with self._lock:
+            if key in self._index:
+                if path.exists():
+                    self._index.move_to_end(key)
+                    return path
+                self._bytes -= self._index.pop(key)
+        # Миниатюру мог создать другой процесс
+        if path.exists():
+            self._add(key, path.stat().st_size)
+            return path
+        return None
+
+    def _add(self, key: str, size: int):
+        with self._lock:
+            self._bytes += size - self._index.pop(key, 0)
+            self._index[key] = size
+            self._evict()
+
+    def _render(self, source_key: str, key: str, bucket: int) -> Path:
+        path = self.directory / key
+        with storage.open(source_key) as source:
+            render_thumbnail(source, path, bucket)
+        self._add(key, path.stat().st_size)
+        return path
+
+    def _record(self, outcome: str, started_at: float) -> float:
+        elapsed = time.perf_counter() - started_at
+        with self._lock:
+            item = self._latency[outcome]
+            item[0] += 1
+            item[1] += elapsed
+            item[2] = max(item[2], elapsed)
+        return elapsed
+
+    async def get(self, source_key: str, key: str, bucket: int):
+        """Возвращает (путь, hit|miss|shared, секунды). FileNotFoundError, если исходника нет"""
+        started_at = time.perf_counter()
+        path = self._lookup(key)
+        if path is not None:
+            return path, 'hit', self._record('hit', started_at)
+
+        task = self._inflight.get(key)
+        outcome = 'shared'
+        if task is None:
+            outcome = 'miss'
+            task = asyncio.ensure_future(run_in_threadpool(self._render, source_key, key, bucket))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Отключение клиента не отменяет уменьшение для остальных ожидающих
+        path = await asyncio.shield(task)
+        return path, outcome, self._record(outcome, started_at)
+
+    def discard_many(self, photo_ids: list):
+        """
+        Удаляет все миниатюры фото, в том числе созданные другими процессами.
+        Каталог просматривается один раз на весь список; файловый ввод-вывод, звать из пула потоков
+        """
+        prefixes = {f"{photo_id}_" for photo_id in photo_ids}
+        if not prefixes:
+            return
+        with os.scandir(self.directory) as entries:
+            names = [
+                entry.name for entry in entries
+                if entry.name.endswith('.jpg') and entry.name[:entry.name.find('_') + 1] in prefixes
+            ]
+        with self._lock:
+            for name in names:
+                self._bytes -= self._index.pop(name, 0)
+        for name in names:
+            (self.directory / name).unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            latency = {
+                outcome: {
+                    'count': count,
+                    'avg_ms': round(total / count * 1000, 2) if count else 0.0,
+                    'max_ms': round(max_seconds * 1000, 2)
+                }
+                for outcome, (count, total, max_seconds) in self._latency.items()
+            }
+            return {
+                'files': len(self._index),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'inflight': len(self._inflight),
+                'latency': latency
+            }
+
+
+thumbnail_cache = ThumbnailCache(THUMBNAIL_DIR, THUMBNAIL_CACHE_BYTES)
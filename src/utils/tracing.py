@@ -0,0 +1,152 @@
+import os
+
+from opentelemetry import context, propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from sqlalchemy import event
+
+# none - трассировка выключена (no-op, без накладных расходов); console - в stdout;
+# otlp - в коллектор по OTLP/HTTP (нужен opentelemetry-exporter-otlp-proto-http,
+# адрес в OTEL_EXPORTER_OTLP_ENDPOINT); memory - в память процесса, для тестов
+TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', 'none')
+# Доля трасс, которые записываются (решение принимается в корне и наследуется воркером)
+TRACING_SAMPLE_RATIO = float(os.getenv('TRACING_SAMPLE_RATIO', 1.0))
+
+tracer = trace.get_tracer('photo')
+
+# Экспортер в память, если выбран TRACING_EXPORTER=memory: memory_exporter.get_finished_spans()
+memory_exporter = None
+
+_configured = False
+
+
+def _create_exporter(name: str):
+    if name == 'console':
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        return ConsoleSpanExporter()
+    if name == 'otlp':
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if name == 'memory':
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+        return InMemorySpanExporter()
+    raise ValueError(f"Неизвестный TRACING_EXPORTER: {name}")
+
+
+def setup_tracing(service_name: str, exporter=None):
+    """
+    Включает трассировку процесса. exporter - любой SpanExporter OpenTelemetry,
+    по умолчанию создается по TRACING_EXPORTER. Повторный вызов ничего не меняет
+    """
+    global _configured, memory_exporter
+    if _configured or (exporter is None and TRACING_EXPORTER == 'none'):
+        return
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    exporter = exporter or _create_exporter(TRACING_EXPORTER)
+    provider = TracerProvider(
+        resource=Resource.create({'service.name': service_name}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO))
+    )
+    if isinstance(exporter, InMemorySpanExporter):
+        # Для тестов спаны должны быть видны сразу после завершения
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+        memory_exporter = exporter
+    else:
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _configured = True
+
+
+def inject_headers(headers: dict):
+    """Кладет контекст текущего спана (traceparent/tracestate) в заголовки сообщения"""
+    propagate.inject(headers)
+
+
+def start_remote_span(name: str, carrier: dict, kind: SpanKind = SpanKind.CONSUMER, **attributes):
+    """
+    Открывает спан-продолжение трассы из заголовков и делает его текущим.
+    Возвращает (span, token) для end_remote_span
+    """
+    parent = propagate.extract(carrier)
+    span = tracer.start_span(name, context=parent, kind=kind, attributes=attributes)
+    token = context.attach(trace.set_span_in_context(span, parent))
+    return span, token
+
+
+def end_remote_span(span, token, error: bool = False):
+    if error:
+        span.set_status(Status(StatusCode.ERROR))
+    span.end()
+    context.detach(token)
+
+
+def trace_engine(engine):
+    """Спан на каждый SQL-запрос движка, дочерний к текущему"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if not trace.get_current_span().is_recording():
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'SQL'
+        context._trace_span = tracer.start_span(
+            f"db.{operation.lower()}",
+            kind=SpanKind.CLIENT,
+            attributes={'db.system': conn.dialect.name, 'db.statement': statement[:1000]}
+        )
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, '_trace_span', None)
+        if span is not None:
+            span.end()
+            context._trace_span = None
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(exception_context):
+        span = getattr(exception_context.execution_context, '_trace_span', None)
+        if span is not None:
+            span.record_exception(exception_context.original_exception)
+            span.set_status(Status(StatusCode.ERROR))
+            span.end()
+            exception_context.execution_context._trace_span = None
+
+
+class TracingMiddleware:
+    """
+    Серверный спан на каждый HTTP-запрос. Входящий traceparent продолжает трассу клиента;
+    имя спана - шаблон маршрута, чтобы запросы к разным фото группировались
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        carrier = {key.decode('latin-1'): value.decode('latin-1') for key, value in scope['headers']}
+        span, token = start_remote_span(f"{scope['method']} {scope['path']}", carrier, SpanKind.SERVER, **{
+            'http.request.method': scope['method'],
+            'url.path': scope['path'],
+        })
+        status = 500
+
+        async def tracked_send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, tracked_send)
+        finally:
+            route = scope.get('route')
+            if route is not None:
+                span.update_name(f"{scope['method']} {route.path}")
+                span.set_attribute('http.route', route.path)
+            span.set_attribute('http.response.status_code', status)
+            end_remote_span(span, token, error=status >= 500)
@@ -0,0 +1,168 @@
+import hashlib
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import aiofiles
+from fastapi import UploadFile
+from starlette.responses import JSONResponse
+
+from src.utils.storage import STORAGE_ROOT
+
+# Размер куска при копировании загрузки на диск: столько максимум держим в памяти на одну загрузку
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 1024 * 1024))
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 30 * 1024 * 1024))
+# Ограничения пакетной загрузки /photo/upload/batch
+MAX_BATCH_FILES = int(os.getenv('MAX_BATCH_FILES', 500))
+MAX_BATCH_UPLOAD_SIZE = int(os.getenv('MAX_BATCH_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024))
+# Прием загрузок и недокачанные файлы возобновляемых загрузок: рядом с хранилищем, на том же томе
+PARTIAL_DIR = STORAGE_ROOT / "partial"
+# Запас на заголовки multipart при проверке размера всего тела запроса
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Сигнатуры форматов по первым байтам файла
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'BM', 'image/bmp'),
+)
+
+# Расширение сохраненного файла по определенному типу
+EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/bmp': '.bmp',
+    'image/webp': '.webp',
+}
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsupportedImage(Exception):
+    pass
+
+
+@dataclass
+class SavedUpload:
+    path: Path
+    size: int
+    sha256: str
+    mime_type: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
+def partial_path(upload_id: str) -> Path:
+    return PARTIAL_DIR / upload_id
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Тип изображения по magic bytes, None если формат не поддерживается"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, mime_type in _SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    return None
+
+
+async def save_upload(file: UploadFile, dest: Path, max_size: int = MAX_UPLOAD_SIZE) -> SavedUpload:
+    """
+    Копирует загруженный файл на диск кусками по UPLOAD_CHUNK_SIZE, по пути считая sha256
+    и определяя тип по первым байтам. Превышение max_size прерывает копирование сразу
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    mime_type = None
+    try:
+        async with aiofiles.open(dest, 'wb') as out_file:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                if mime_type is None:
+                    mime_type = sniff_image_type(chunk)
+                    if mime_type is None:
+                        raise UnsupportedImage()
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge()
+                hasher.update(chunk)
+                await out_file.write(chunk)
+        if mime_type is None:
+            raise UnsupportedImage()
+    except BaseException:
+        dest.unlink(missing_ok=True)
+        raise
+    return SavedUpload(path=dest, size=size, sha256=hasher.hexdigest(), mime_type=mime_type)
+
+
+def inspect_file(path: Path) -> SavedUpload:
+    """Размер, sha256 и тип уже записанного на диск файла, читается кусками"""
+    hasher = hashlib.sha256()
+    size = 0
+    mime_type = None
+    with open(path, 'rb') as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            if mime_type is None:
+                mime_type = sniff_image_type(chunk)
+                if mime_type is None:
+                    raise UnsupportedImage()
+            size += len(chunk)
+            hasher.update(chunk)
+    if mime_type is None:
+        raise UnsupportedImage()
+    return SavedUpload(path=path, size=size, sha256=hasher.hexdigest(), mime_type=mime_type)
+
+
+class BodySizeLimitMiddleware:
+    """
+    Ограничивает размер тела запроса для путей загрузки до разбора multipart:
+    по Content-Length сразу, а для chunked-запросов - по мере чтения.
+    При превышении во время чтения 413 отправляется отсюда же, а приложение получает
+    http.disconnect и прекращает разбор; его собственный ответ уже не отправляется
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope['path']) if scope['type'] == 'http' else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        too_large = JSONResponse({'detail': 'Файл слишком большой'}, status_code=413)
+        content_length = dict(scope['headers']).get(b'content-length')
+        if content_length is not None and int(content_length) > limit:
+            return await too_large(scope, receive, send)
+
+        received = 0
+        response_started = False
+        rejected = False
+        responded = False
+
+        async def limited_receive():
+            nonlocal received, rejected, responded
+            if rejected:
+                return {'type': 'http.disconnect'}
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    rejected = True
+                    if not response_started:
+                        responded = True
+                        await too_large(scope, receive, send)
+                    return {'type': 'http.disconnect'}
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if responded:
+                return
+            if message['type'] == 'http.response.start':
+                response_started = True
+            await send(message)
+
+        await self.app(scope, limited_receive, tracked_send)
@@ -1,14 +1,18 @@
-import smtplib
 import os
-from email.mime.text import MIMEText
-from email.header import Header
 import secrets
 import hashlib
+import base64
+import json
 import bcrypt
+from datetime import datetime
+
+
+# Стоимость bcrypt для новых хешей; старые хеши пересчитываются при входе
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
 
 
 def hash_password(password: str) -> bytes:
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     pwd_bytes = password.encode()
     return bcrypt.hashpw(pwd_bytes, salt)
 
@@ -17,33 +21,36 @@ def validate_password(password: str, hash: str) -> bool:
     return bcrypt.checkpw(password.encode(), bytes.fromhex(hash))
 
 
-def generate_verify_code():
-    return secrets.randbelow(900000) + 100000
-
-
-def send_register_email(receiver, message):
-    sender = "prohanter34@yandex.ru"
-    password = os.getenv("EMAIL_PASSWORD")
-    msg = MIMEText(f'{message}', 'plain', 'utf-8')
-    msg['Subject'] = Header('Регистрация в Clear Photo', 'utf-8')
-    msg['From'] = sender
-    msg['To'] = receiver
-
-    server = smtplib.SMTP("smtp.yandex.ru", 587, timeout=100)
-
+def password_needs_rehash(hash: str) -> bool:
+    """Хеш вида $2b$12$... посчитан с другой стоимостью, чем BCRYPT_ROUNDS"""
     try:
-        server.starttls()
-        server.login(sender, password)
-        server.sendmail(sender, receiver, msg.as_string())
-        return 0
+        return int(bytes.fromhex(hash).split(b'$')[2]) != BCRYPT_ROUNDS
+    except (ValueError, IndexError):
+        return False
 
-    except Exception as _ex:
-        print(_ex)
-        return 1
+
+def generate_verify_code():
+    return secrets.randbelow(900000) + 100000
 
 
 def get_hash(message: str):
     hash = hashlib.new("sha256")
     hash.update(message.encode())
     hashCode = hash.hexdigest()
-    return hashCode
\ No newline at end of file
+    return hashCode
+
+
+def encode_cursor(timestamp: datetime, photo_id: int) -> str:
+    """Непрозрачный курсор keyset-пагинации из ключа (timestamp, id)"""
+    raw = json.dumps([timestamp.isoformat(), photo_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """Обратное преобразование курсора, None если курсор поврежден"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, photo_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(photo_id)
+    except Exception:
+        return None